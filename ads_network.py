@@ -0,0 +1,107 @@
+"""Перехват JSON-ответов дашборда VK Ads.
+
+Список групп и их статистику дашборд получает XHR-запросами. Коллектор
+слушает ``page.on("response")`` и складывает из этих ответов структурированный
+кэш ID группы → название и признак наличия статистики. По нему группы без
+данных отсеиваются до кликов в интерфейсе.
+"""
+import json
+import logging
+import threading
+
+# Разбираем только ответы по группам (списки и статистика ad_groups): у
+# кампаний и объявлений свои ID, которые могут совпасть с ID группы
+API_URL_MARKERS = ("ad_group",)
+
+# Ключи, под которыми в ответах лежат метрики
+_STATS_KEYS = ("stats", "statistics", "total", "base", "rows")
+_METRIC_KEYS = ("shows", "impressions", "clicks", "spent", "goals", "reach")
+
+
+def _scan_metrics(node) -> tuple[bool, bool]:
+    """(нашлись ли метрики в поддереве, есть ли среди них ненулевая)."""
+    seen = positive = False
+    if isinstance(node, dict):
+        items = node.items()
+    elif isinstance(node, list):
+        items = enumerate(node)
+    else:
+        return seen, positive
+    for key, value in items:
+        if key in _METRIC_KEYS:
+            try:
+                number = float(value)
+            except (TypeError, ValueError):
+                pass
+            else:
+                seen = True
+                positive = positive or number > 0
+        if isinstance(value, (dict, list)):
+            sub_seen, sub_positive = _scan_metrics(value)
+            seen, positive = seen or sub_seen, positive or sub_positive
+    return seen, positive
+
+
+class AdsResponseCollector:
+    def __init__(self):
+        self.groups: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def attach(self, page) -> None:
+        page.on("response", self._on_response)
+
+    def _on_response(self, response) -> None:
+        try:
+            if response.request.resource_type not in ("xhr", "fetch"):
+                return
+            if not any(marker in response.url for marker in API_URL_MARKERS):
+                return
+            if "json" not in (response.headers.get("content-type") or ""):
+                return
+            payload = response.json()
+        except Exception:
+            # Тело недоступно (редирект, прерванный запрос) — просто пропускаем
+            return
+        self._collect(payload)
+
+    def _collect(self, node) -> None:
+        """Группы из ответа: объекты с числовым ``id`` в списках и обёртках.
+
+        Внутрь найденной группы не спускаемся — вложенные объекты с ``id``
+        (кампания, объявления) группами не являются.
+        """
+        if isinstance(node, list):
+            for item in node:
+                self._collect(item)
+            return
+        if not isinstance(node, dict):
+            return
+
+        group_id = node.get("id")
+        if isinstance(group_id, (int, str)) and str(group_id).isdigit():
+            stats = [node[key] for key in _STATS_KEYS if key in node]
+            with self._lock:
+                entry = self.groups.setdefault(str(group_id), {"name": None, "has_stats": None})
+                if isinstance(node.get("name"), str):
+                    entry["name"] = node["name"].strip()
+                seen, positive = _scan_metrics(stats)
+                if seen:
+                    # Статистика могла прийти разными запросами — хватит одной ненулевой
+                    entry["has_stats"] = bool(entry["has_stats"]) or positive
+            return
+
+        for value in node.values():
+            if isinstance(value, (dict, list)):
+                self._collect(value)
+
+    def lookup(self, group_id: str) -> dict | None:
+        with self._lock:
+            entry = self.groups.get(group_id)
+            return dict(entry) if entry else None
+
+    def save(self, path: str) -> None:
+        with self._lock:
+            data = dict(self.groups)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        logging.info(f"🛰️  Данные API VK Ads ({len(data)} объектов) сохранены: {path}")
@@ -1,8 +1,22 @@
 # ads_screenshot.py
 from playwright.sync_api import sync_playwright
+from PIL import Image
+import io
 import os
 import time
 import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+from ads_network import AdsResponseCollector
+from browser_utils import launch_chromium
+from dom_probe import element_boxes, probe
+from image_pipeline import crop_png
+from screenshot_cache import date_range_from_url
+from selector_registry import SelectorRegistry
+from wait_utils import pause, track_requests, wait_ready
 
 ###############################################################################
 #  VK Ads — automatic screenshots with **strict** ad-plan matching            #
@@ -24,7 +38,7 @@ def _handle_vk_id_auth(page):
     logging.info("🔐 Проверяем необходимость авторизации через VK ID...")
     
     # Ждем загрузки страницы
-    page.wait_for_timeout(3000)
+    wait_ready(page, "page")
     
     # Проверяем, находимся ли мы на странице VK ID авторизации
     vk_id_indicators = [
@@ -74,12 +88,12 @@ def _handle_vk_id_auth(page):
     try:
         # Кликаем на кнопку "Продолжить как..."
         continue_button.scroll_into_view_if_needed()
-        page.wait_for_timeout(1000)
+        pause(page, 1000)
         continue_button.click()
         logging.info("✅ Нажата кнопка 'Продолжить как...'")
         
         # Ждем появления модального окна
-        page.wait_for_timeout(3000)
+        wait_ready(page, "page")
         
         # Обрабатываем страницу подтверждения VK ID
         return _handle_modal_confirmation(page)
@@ -94,7 +108,7 @@ def _handle_modal_confirmation(page):
     logging.info("🪟 Обрабатываем страницу подтверждения VK ID...")
     
     # Ждем загрузки страницы подтверждения
-    page.wait_for_timeout(3000)
+    wait_ready(page, "page")
     
     # Проверяем, находимся ли мы на странице подтверждения VK ID
     vkid_confirmation_indicators = [
@@ -202,7 +216,7 @@ def _handle_modal_confirmation(page):
             # Пробуем нажать Enter для подтверждения
             try:
                 page.keyboard.press("Enter")
-                page.wait_for_timeout(3000)
+                wait_ready(page, "page")
                 logging.info("✅ Попытка подтверждения через Enter")
                 return True
             except:
@@ -216,9 +230,9 @@ def _handle_modal_confirmation(page):
         # Метод 1: Обычный клик
         try:
             confirmation_element.scroll_into_view_if_needed()
-            page.wait_for_timeout(500)
+            pause(page, 500)
             confirmation_element.click(timeout=5000)
-            page.wait_for_timeout(3000)  # Увеличено время ожидания
+            wait_ready(page, "page")
             logging.info("✅ Подтверждение VK ID выполнено (обычный клик)")
             success = True
         except Exception as e:
@@ -228,7 +242,7 @@ def _handle_modal_confirmation(page):
         if not success:
             try:
                 page.evaluate("arguments[0].click()", confirmation_element.element_handle())
-                page.wait_for_timeout(3000)
+                wait_ready(page, "page")
                 logging.info("✅ Подтверждение VK ID выполнено (JS клик)")
                 success = True
             except Exception as e:
@@ -239,16 +253,13 @@ def _handle_modal_confirmation(page):
             try:
                 confirmation_element.focus()
                 page.keyboard.press("Enter")
-                page.wait_for_timeout(3000)
+                wait_ready(page, "page")
                 logging.info("✅ Подтверждение VK ID выполнено (Enter)")
                 success = True
             except Exception as e:
                 logging.warning(f"⚠️  Enter не сработал: {e}")
         
-        # Дополнительное ожидание после подтверждения
         if success:
-            page.wait_for_timeout(2000)
-            
             # Проверяем, что мы покинули страницу подтверждения
             try:
                 page.wait_for_load_state("networkidle", timeout=10000)
@@ -284,7 +295,7 @@ def _scroll_to_bottom(page, step: int = 700):
         """,
         step,
     )
-    page.wait_for_timeout(400)
+    pause(page, 400)
 
 
 def _is_captcha(page):
@@ -296,6 +307,161 @@ def _is_captcha(page):
     )
 
 
+# ────────────────────────────── selectors ───────────────────────────────────
+
+
+# Порядок кандидатов в каскадах запоминается между запусками
+_SELECTORS = SelectorRegistry("selectors_cache.json")
+
+_SEARCH_INPUT_SELECTORS = [
+    "input[type='search']",
+    "input[placeholder*='Поиск']",
+    "input[placeholder*='поиск']",
+    "[data-testid*='search'] input",
+    ".search input",
+    "input[name*='search']",
+]
+
+_STATS_BUTTON_SELECTORS = [
+    "a[data-testid='stats']",
+    "[data-testid='stats']",
+    "button[title*='Статистика']",
+    "a[title*='Статистика']",
+    "svg.vkuiIcon--poll_outline_20",
+    "svg[class*='poll_outline']",
+    "svg[aria-label*='Статистика']",
+    "button:has(svg[class*='poll_outline'])",
+]
+
+_FUNNEL_SELECTORS = [
+    "div[class*='ConversionsChart'][class*='wrap']",
+    "div[class^='ConversionsChart_wrap']",
+    "div[class^='ConversionsChart.module_wrap']",
+    "div.ConversionsChart\\.module_wrap__XzgxY"
+]
+
+# Основной контейнер вкладок демографии и географии
+_VIEWPOINTS_CONTAINER_SELECTORS = [
+    "div[class*='ViewPoints'][class*='layout']",
+    "div.ViewPoints\\.module_layout__YWJjY",
+    "div[class^='ViewPoints_layout']",
+    "div[class^='ViewPoints_main']"
+]
+
+_DEMOGRAPHY_TITLE_SELECTORS = [
+    "span[class*='TopLine'][class*='title']:has-text('ЦР26')",
+    "span[class*='TopLine'][class*='title']:has-text('ЦК26')",
+    "span:has-text('ЦР26_')",
+    "span:has-text('ЦК26_')"
+]
+
+# Нижние блоки статистики демографии
+_DEMOGRAPHY_BOTTOM_SELECTORS = [
+    "div[class*='Compare'][class*='layout']",
+    "div.Compare\\.module_layout__YzVmZ",
+    "div[class*='Demography'][class*='wrap']",
+    "div.Demography\\.module_wrap__YjkyN"
+]
+
+# Крестик закрытия статистики (cancel_24 и cancel_16). Порядок важен:
+# cancel_16 совпадает и с крестиком поиска, поэтому каскад не переупорядочивается
+_CLOSE_SELECTORS = [
+    # Точные селекторы для SVG с cancel (24 и 16)
+    "svg.vkuiIcon--cancel_24",
+    "svg.vkuiIcon--cancel_16",
+    "svg[class*='vkuiIcon--cancel_24']",
+    "svg[class*='vkuiIcon--cancel_16']",
+    "svg[class*='cancel_24']",
+    "svg[class*='cancel_16']",
+    # Кнопки, содержащие этот SVG
+    "button:has(svg.vkuiIcon--cancel_24)",
+    "button:has(svg.vkuiIcon--cancel_16)",
+    "button:has(svg[class*='cancel_24'])",
+    "button:has(svg[class*='cancel_16'])",
+    "[role='button']:has(svg[class*='cancel_24'])",
+    "[role='button']:has(svg[class*='cancel_16'])",
+    # Родительские элементы с aria-label
+    "button[aria-label*='Закрыть']",
+    "button[aria-label*='закрыть']",
+    "button[aria-label*='Close']",
+    "button[aria-label*='close']",
+    # По data-testid
+    "[data-testid*='close']",
+    "[data-testid*='Close']",
+    # Общие селекторы для модальных окон
+    ".modal-close",
+    ".close-button",
+    ".dialog-close",
+    # Поиск по viewBox SVG
+    "svg[viewBox='0 0 24 24']:has(use[xlink:href='#cancel_24'])",
+    "svg[viewBox='0 0 16 16']:has(use[xlink:href='#cancel_16'])",
+    "button:has(svg[viewBox='0 0 24 24']:has(use[xlink:href='#cancel_24']))",
+    "button:has(svg[viewBox='0 0 16 16']:has(use[xlink:href='#cancel_16']))"
+]
+
+# Крестик очистки поиска (SVG с cancel_16)
+_CLEAR_SELECTORS = [
+    # Точные селекторы для VK cancel_16 SVG из вашего примера
+    "svg.vkuiIcon--cancel_16",
+    "svg[class*='vkuiIcon--cancel_16']",
+    "svg[class*='vkuiIcon vkuiIcon--16 vkuiIcon--w-16 vkuiIcon--h-16 vkuiIcon--cancel_16']",
+    "svg.vkuiIcon--16.vkuiIcon--cancel_16",
+    # SVG с use и xlink:href для cancel_16
+    "svg:has(use[xlink:href='#cancel_16'])",
+    "svg[viewBox='0 0 16 16']:has(use[xlink:href='#cancel_16'])",
+    # Кнопки, содержащие эти SVG
+    "button:has(svg.vkuiIcon--cancel_16)",
+    "button:has(svg[class*='cancel_16'])",
+    "button:has(svg:has(use[xlink:href='#cancel_16']))",
+    "[role='button']:has(svg[class*='cancel_16'])",
+    # Дополнительные селекторы
+    "[data-testid*='clear']",
+    "[data-testid*='search-clear']",
+    "input[type='search'] + button",
+    ".search-clear",
+    # Поиск по aria-label
+    "button[aria-label*='очистить']",
+    "button[aria-label*='Очистить']",
+    "button[aria-label*='clear']",
+    "button[aria-label*='Clear']"
+]
+
+
+def _ordered(name: str | None, candidates) -> list[str]:
+    return _SELECTORS.ordered(name, candidates) if name else list(candidates)
+
+
+def _first_present(scope, name: str | None, candidates):
+    """Первый кандидат каскада *name*, у которого есть элементы.
+
+    Возвращает (locator, selector) или (None, None). Весь каскад проверяется
+    одним запросом к странице. Сработавший селектор запоминается в реестре и
+    в следующий раз проверяется первым; при *name* = None каскад идёт строго
+    в исходном порядке.
+    """
+    candidates = _ordered(name, candidates)
+    loc, selector = probe(scope, candidates).first_present(candidates)
+    if loc and name:
+        _SELECTORS.record(name, selector)
+    return loc, selector
+
+
+def _first_visible(scope, name: str | None, candidates):
+    """Как _first_present, но нужен видимый элемент."""
+    candidates = _ordered(name, candidates)
+    loc, selector = probe(scope, candidates).first_visible(candidates)
+    if loc and name:
+        _SELECTORS.record(name, selector)
+    return loc, selector
+
+
+def _find_stats_button(scope):
+    btn, selector = _first_present(scope, "stats_button", _STATS_BUTTON_SELECTORS)
+    if btn:
+        logging.info(f"✅ Найдена кнопка статистики: {selector}")
+    return btn
+
+
 # ────────────────────────────── shot helpers ────────────────────────────────
 
 
@@ -303,10 +469,10 @@ def _topline_loc(page):
     return page.locator("div[class^='TopLine_topline']").first
 
 
-def _union_clip(a: dict, b: dict):
-    x1, y1 = min(a["x"], b["x"]), min(a["y"], b["y"])
-    x2 = max(a["x"] + a["width"], b["x"] + b["width"])
-    y2 = max(a["y"] + a["height"], b["y"] + b["height"])
+def _union_clip(*boxes: dict):
+    x1, y1 = min(b["x"] for b in boxes), min(b["y"] for b in boxes)
+    x2 = max(b["x"] + b["width"] for b in boxes)
+    y2 = max(b["y"] + b["height"] for b in boxes)
     return {"x": int(x1), "y": int(y1), "width": int(x2 - x1), "height": int(y2 - y1)}
 
 
@@ -317,12 +483,13 @@ def _shot_with_topline(page, target, path):
             target.screenshot(path=path)
             return
         target.scroll_into_view_if_needed()
-        page.wait_for_timeout(500)  # Увеличено в 2 раза
-        bt, bb = top.bounding_box(), target.bounding_box()
-        if bt is None or bb is None:
+        pause(page, 500)
+        # Рамки TopLine и цели — одним запросом
+        boxes, _ = element_boxes(top.or_(target))
+        if len(boxes) < 2:
             target.screenshot(path=path)
             return
-        page.screenshot(path=path, clip=_union_clip(bt, bb))
+        page.screenshot(path=path, clip=_union_clip(*boxes))
     except Exception as e:
         logging.error(f"⚠️  Ошибка при создании скриншота с TopLine: {e}")
         target.screenshot(path=path)
@@ -332,12 +499,13 @@ def _shot_with_caption(page, caption, target, path):
     try:
         caption.scroll_into_view_if_needed()
         target.scroll_into_view_if_needed()
-        page.wait_for_timeout(400)  # Увеличено в 2 раза
-        bc, bt = caption.bounding_box(), target.bounding_box()
-        if bc is None or bt is None:
+        pause(page, 400)
+        # Рамки подписи и цели — одним запросом
+        boxes, _ = element_boxes(caption.or_(target))
+        if len(boxes) < 2:
             target.screenshot(path=path)
             return
-        page.screenshot(path=path, clip=_union_clip(bc, bt))
+        page.screenshot(path=path, clip=_union_clip(*boxes))
     except Exception as e:
         logging.error(f"⚠️  Ошибка при создании скриншота с подписью: {e}")
         target.screenshot(path=path)
@@ -357,77 +525,50 @@ def _shot_demography_section(page, path, demography_zoom=1.0):
         if (demography_zoom != 1.0):
             original_zoom = page.evaluate("document.body.style.zoom")
             page.evaluate(f"document.body.style.zoom = '{demography_zoom}'")
-            page.wait_for_timeout(1000)  # Увеличено в 2 раза
+            wait_ready(page, "layout")
         # Прокручиваем в самый верх страницы
         page.evaluate("window.scrollTo(0, 0)")
-        page.wait_for_timeout(600)  # Увеличено в 2 раза
+        pause(page, 600)
         
         # Ищем основной контейнер демографии - более точные селекторы
-        main_container_selectors = [
-            "div[class*='ViewPoints'][class*='layout']",
-            "div.ViewPoints\\.module_layout__YWJjY", 
-            "div[class^='ViewPoints_layout']",
-            "div[class^='ViewPoints_main']"
-        ]
-        
-        main_container = None
-        for selector in main_container_selectors:
-            container = page.locator(selector).first
-            if container.count():
-                main_container = container
-                logging.info(f"✅ Найден контейнер демографии: {selector}")
-                break
-        
+        main_container, selector = _first_present(page, "demography_container", _VIEWPOINTS_CONTAINER_SELECTORS)
         if main_container:
+            logging.info(f"✅ Найден контейнер демографии: {selector}")
             # Ждем загрузки контента
-            page.wait_for_timeout(2000)  # Увеличено в 2 раза
+            wait_ready(page, "tab")
             
             # Находим заголовок с названием кампании 
-            title_selectors = [
-                "span[class*='TopLine'][class*='title']:has-text('ЦР26')",
-                "span[class*='TopLine'][class*='title']:has-text('ЦК26')",
-                "span:has-text('ЦР26_')",
-                "span:has-text('ЦК26_')"
-            ]
-            
-            title_element = None
-            for selector in title_selectors:
-                title_element = page.locator(selector).first
-                if title_element.count():
-                    logging.info(f"✅ Найден заголовок: {selector}")
-                    break
+            title_element, selector = _first_present(page, "demography_title", _DEMOGRAPHY_TITLE_SELECTORS)
+            if title_element:
+                logging.info(f"✅ Найден заголовок: {selector}")
             
             # Ищем нижние блоки статистики - более широкий поиск
-            bottom_selectors = [
-                "div[class*='Compare'][class*='layout']",
-                "div.Compare\\.module_layout__YzVmZ",
-                "div[class*='Demography'][class*='wrap']", 
-                "div.Demography\\.module_wrap__YjkyN"
-            ]
+            bottom_selectors = _DEMOGRAPHY_BOTTOM_SELECTORS
             
-            bottom_elements = []
-            for selector in bottom_selectors:
-                elements = page.locator(selector).all()
-                bottom_elements.extend(elements)
+            # Все селекторы нижних блоков проверяются одним запросом
+            found = probe(page, bottom_selectors)
+            counts = {selector: found.count(selector) for selector in bottom_selectors}
+            present = [selector for selector in bottom_selectors if counts[selector]]
             
-            if bottom_elements:
-                logging.info(f"✅ Найдено {len(bottom_elements)} блоков статистики")
-                bottom_element = bottom_elements[-1]  # Берем последний элемент
+            if present:
+                logging.info(f"✅ Найдено {sum(counts.values())} блоков статистики")
+                # Берем последний элемент
+                bottom_element = page.locator(present[-1]).nth(counts[present[-1]] - 1)
             else:
                 bottom_element = None
             
-            if title_element and title_element.count() and bottom_element:
+            if title_element and bottom_element:
                 # Прокручиваем к заголовку 
                 title_element.scroll_into_view_if_needed()
-                page.wait_for_timeout(600)  # Увеличено в 2 раза
+                pause(page, 600)
                 
-                # Получаем координаты
-                title_box = title_element.bounding_box()
-                bottom_box = bottom_element.bounding_box()
+                # Координаты заголовка, нижнего блока и ширина окна — одним запросом
+                boxes, viewport = element_boxes(title_element.or_(bottom_element))
                 
-                if (title_box and bottom_box):
+                if len(boxes) == 2:
+                    title_box, bottom_box = boxes
                     # Определяем оптимальную область скриншота
-                    viewport_width = page.evaluate("window.innerWidth")
+                    viewport_width = viewport["width"]
                     
                     # Находим левую границу по контенту
                     content_left = min(title_box["x"], bottom_box["x"])
@@ -460,7 +601,7 @@ def _shot_demography_section(page, path, demography_zoom=1.0):
         logging.warning("⚠️  Не удалось найти точные элементы, делаем скриншот основного контейнера")
         if main_container:
             main_container.scroll_into_view_if_needed()
-            page.wait_for_timeout(600)  # Увеличено в 2 раза
+            pause(page, 600)
             main_container.screenshot(path=path)
             logging.info(f"✅ Скриншот контейнера демографии: {path}")
         else:
@@ -494,73 +635,30 @@ def _shot_geo_section(page, path, geo_zoom=1.0):
         if geo_zoom != 1.0:
             original_zoom = page.evaluate("document.body.style.zoom")
             page.evaluate(f"document.body.style.zoom = '{geo_zoom}'")
-            page.wait_for_timeout(1000)  # Увеличено в 2 раза
+            wait_ready(page, "layout")
         
         # Прокручиваем в самый верх страницы
         page.evaluate("window.scrollTo(0, 0)")
-        page.wait_for_timeout(600)  # Увеличено в 2 раза
+        pause(page, 600)
         
         # Ждем завершения сетевых запросов (карты часто загружаются через API)
-        try:
-            logging.info("⏳ Ожидание сетевых запросов...")
-            page.wait_for_load_state("networkidle", timeout=6000)  # Увеличено в 2 раза
+        logging.info("⏳ Ожидание сетевых запросов...")
+        if wait_ready(page, "network"):
             logging.info("✅ Сетевые запросы завершены")
-        except Exception:
-            logging.warning("⚠️  Timeout сетевых запросов, продолжаем...")
         
         # Ищем основной контейнер географии - более точные селекторы
-        geo_container_selectors = [
-            "div[class*='ViewPoints'][class*='layout']",
-            "div.ViewPoints\\.module_layout__YWJjY",
-            "div[class^='ViewPoints_layout']",
-            "div[class^='ViewPoints_main']"
-        ]
-        
-        main_container = None
-        for selector in geo_container_selectors:
-            container = page.locator(selector).first
-            if container.count():
-                main_container = container
-                logging.info(f"✅ Найден контейнер географии: {selector}")
-                break
-        
+        main_container, selector = _first_present(page, "geo_container", _VIEWPOINTS_CONTAINER_SELECTORS)
         if main_container:
+            logging.info(f"✅ Найден контейнер географии: {selector}")
             # Прокручиваем к контейнеру
             main_container.scroll_into_view_if_needed()
-            page.wait_for_timeout(1000)  # Увеличено в 2 раза
+            pause(page, 1000)
             
-            # Ждем загрузки карты - ищем элементы карты
+            # Ждем появления карты и завершения её отрисовки
             logging.info("⏳ Ожидание загрузки карты...")
-            map_selectors = [
-                "canvas.mmrgl-canvas",  # Специфический класс для VK Maps
-                "div.mmrgl-map",        # Контейнер карты
-                "canvas",               # Общий canvas элемент
-                "div[class*='GeoMap']", # Контейнер географической карты
-                "div[class*='map']"     # Любой контейнер с map
-            ]
-            
-            # Ждем появления карты
-            map_loaded = False
-            for attempt in range(16):  # Увеличено в 2 раза (было 8)
-                for selector in map_selectors:
-                    map_elements = page.locator(selector)
-                    if map_elements.count() > 0:
-                        logging.info(f"✅ Карта найдена: {selector} ({map_elements.count()} элементов)")
-                        map_loaded = True
-                        break
-                
-                if map_loaded:
-                    break
-                    
-                logging.info(f"⏳ Попытка {attempt + 1}/16 - ждем карту...")
-                page.wait_for_timeout(2000)  # Увеличено в 2 раза
-            
-            if not map_loaded:
+            if not wait_ready(page, "geo_map"):
                 logging.warning("⚠️  Карта не найдена, но продолжаем...")
             
-            # Дополнительное ожидание для полной загрузки карты
-            page.wait_for_timeout(3000)  # Увеличено в 2 раза
-            
             # Принудительное обновление карт через JavaScript
             try:
                 page.evaluate("""
@@ -573,19 +671,20 @@ def _shot_geo_section(page, path, geo_zoom=1.0):
                     // Trigger resize event
                     window.dispatchEvent(new Event('resize'));
                 """)
-                page.wait_for_timeout(2000)  # Увеличено в 2 раза
+                wait_ready(page, "layout")
             except Exception:
                 pass
             
             logging.info("✅ Ожидание завершено, создаем скриншот")
             
-            # Получаем координаты контейнера для точного скриншота
-            container_box = main_container.bounding_box()
+            # Координаты контейнера и размер окна — одним запросом
+            boxes, viewport = element_boxes(main_container)
+            container_box = boxes[0] if boxes else None
             
             if container_box:
                 # Определяем оптимальную область для географии
-                viewport_width = page.evaluate("window.innerWidth")
-                viewport_height = page.evaluate("window.innerHeight")
+                viewport_width = viewport["width"]
+                viewport_height = viewport["height"]
                 
                 # Минимальные отступы для захвата всего контента
                 start_x = max(0, container_box["x"] - 10)
@@ -628,6 +727,418 @@ def _shot_geo_section(page, path, geo_zoom=1.0):
                 pass
 
 
+# ────────────────────────────── crop capture ────────────────────────────────
+
+
+# Режимы съёмки вкладок: element — отдельные скриншоты с прокруткой к
+# элементам, crop — один снимок всей вкладки и вырезка областей через PIL
+CAPTURE_MODES = ("element", "crop")
+
+# Области вкладок для режима crop. Элемент области ищется по селекторам,
+# затем по тексту внутри элемента, подходящего под селектор.
+_CROP_REGIONS = {
+    "overview": {
+        "caption": {"texts": [["Воронка конверсий", "*"]]},
+        "funnel": {"selectors": _FUNNEL_SELECTORS},
+    },
+    "demography": {
+        "title": {"texts": [["ЦР26", "span[class*='TopLine'][class*='title']"],
+                            ["ЦК26", "span[class*='TopLine'][class*='title']"],
+                            ["ЦР26_", "span"], ["ЦК26_", "span"]]},
+        # Берём последний найденный блок статистики
+        "bottom": {"selectors": _DEMOGRAPHY_BOTTOM_SELECTORS, "last": True},
+    },
+    "geo": {
+        "container": {"selectors": _VIEWPOINTS_CONTAINER_SELECTORS},
+    },
+}
+
+_REGIONS_JS = """
+regions => {
+    const sx = window.scrollX, sy = window.scrollY;
+    // Элемент обрезан прокручиваемым предком — на снимке страницы его не будет целиком
+    const clipped = el => {
+        const r = el.getBoundingClientRect();
+        for (let a = el.parentElement; a && a !== document.body; a = a.parentElement) {
+            const s = getComputedStyle(a);
+            if (s.overflowX === 'visible' && s.overflowY === 'visible') continue;
+            const ar = a.getBoundingClientRect();
+            if (r.top < ar.top - 1 || r.bottom > ar.bottom + 1 || r.left < ar.left - 1 || r.right > ar.right + 1) {
+                return true;
+            }
+        }
+        return false;
+    };
+    const byText = (text, within) => {
+        const walker = document.createTreeWalker(document.body, NodeFilter.SHOW_TEXT);
+        while (walker.nextNode()) {
+            const el = walker.currentNode.parentElement;
+            if (el && walker.currentNode.nodeValue.includes(text) && el.closest(within)) {
+                return el.closest(within);
+            }
+        }
+        return null;
+    };
+    const boxes = {};
+    for (const [name, spec] of Object.entries(regions)) {
+        let el = null;
+        for (const selector of spec.selectors || []) {
+            let found;
+            try { found = document.querySelectorAll(selector); } catch (e) { continue; }
+            if (!found.length) continue;
+            el = spec.last ? found[found.length - 1] : found[0];
+            if (!spec.last) break;
+        }
+        for (const [text, within] of el ? [] : spec.texts || []) {
+            el = byText(text, within);
+            if (el) break;
+        }
+        if (!el) { boxes[name] = null; continue; }
+        const r = el.getBoundingClientRect();
+        boxes[name] = {x: r.x + sx, y: r.y + sy, width: r.width, height: r.height, clipped: clipped(el)};
+    }
+    return {boxes, dpr: window.devicePixelRatio};
+}
+"""
+
+
+def _crop_area(tab: str, boxes: dict, page_width: float) -> dict:
+    """Область вырезки в CSS-пикселях документа, с теми же отступами, что в режиме element."""
+    if tab == "overview":
+        return _union_clip(boxes["caption"], boxes["funnel"])
+    if tab == "demography":
+        area = _union_clip(boxes["title"], boxes["bottom"])
+        x = max(0, area["x"] - 20)
+        y = max(0, area["y"] - 20)
+        right = min(area["x"] + area["width"] + 40, page_width)
+        return {"x": x, "y": y, "width": right - x, "height": area["y"] + area["height"] + 20 - y}
+    box = boxes["container"]
+    x, y = max(0, box["x"] - 10), max(0, box["y"] - 10)
+    return {"x": x, "y": y, "width": box["width"] + 20, "height": box["height"] + 20}
+
+
+def _shot_tab_cropped(page, tab: str, path: str, zoom: float = 1.0, pipeline=None, on_saved=None) -> bool:
+    """Режим crop: один снимок всей вкладки в память и вырезка области через PIL.
+
+    Рамки всех нужных элементов читаются одним запросом, без прокрутки и
+    пауз. False — область не найдена или обрезана прокручиваемой панелью;
+    тогда вкладка снимается обычным способом.
+
+    Args:
+        page: Playwright page объект
+        tab: overview, demography или geo
+        path: Путь для сохранения скриншота
+        zoom: Масштаб страницы на время съёмки (1.0 — без изменения)
+        pipeline: ImagePipeline; вырезка и запись файла идут в фоновом процессе
+        on_saved: Вызывается после записи файла
+    """
+    original_zoom = None
+    try:
+        if zoom != 1.0:
+            original_zoom = page.evaluate("document.body.style.zoom")
+            page.evaluate(f"document.body.style.zoom = '{zoom}'")
+            wait_ready(page, "layout")
+
+        found = page.evaluate(_REGIONS_JS, _CROP_REGIONS[tab])
+        boxes = found["boxes"]
+        missing = [name for name, box in boxes.items() if box is None]
+        if missing:
+            logging.info(f"✂️  Вкладка {tab}: не найдены области {', '.join(missing)}, снимаем по элементам")
+            return False
+        if any(box["clipped"] for box in boxes.values()):
+            logging.info(f"✂️  Вкладка {tab}: область внутри прокручиваемой панели, снимаем по элементам")
+            return False
+
+        png = page.screenshot(full_page=True)
+        # Открытие PNG читает только заголовок — размер известен без декодирования
+        image = Image.open(io.BytesIO(png))
+        scale = found["dpr"] or 1
+        area = _crop_area(tab, boxes, image.width / scale)
+        left, top = int(area["x"] * scale), int(area["y"] * scale)
+        right = int((area["x"] + area["width"]) * scale)
+        bottom = int((area["y"] + area["height"]) * scale)
+        if right > image.width or bottom > image.height or right <= left or bottom <= top:
+            logging.info(f"✂️  Вкладка {tab}: область за пределами снимка, снимаем по элементам")
+            return False
+
+        if pipeline is not None:
+            pipeline.crop(png, (left, top, right, bottom), path, on_saved)
+        else:
+            crop_png(png, (left, top, right, bottom), path)
+            if on_saved is not None:
+                on_saved()
+        logging.info(f"✂️  Вкладка {tab} вырезана из снимка: {path} ({right - left}x{bottom - top})")
+        return True
+    except Exception as e:
+        logging.warning(f"⚠️  Вырезка вкладки {tab} не удалась, снимаем по элементам: {e}")
+        return False
+    finally:
+        if original_zoom is not None:
+            try:
+                page.evaluate(f"document.body.style.zoom = '{original_zoom if original_zoom else 'initial'}'")
+            except Exception:
+                pass
+
+
+# ────────────────────────────── deep links ──────────────────────────────────
+
+
+# Параметры дашборда, которые должны сохраниться в прямой ссылке на статистику
+_DASHBOARD_PARAMS = ("sudo", "mode", "attribution", "date_from", "date_to")
+_DEEP_LINK_MAX_FAILURES = 3
+
+
+def _with_dashboard_params(url: str, ads_url: str) -> str:
+    """Переносит период, аккаунт и режим из *ads_url* в *url*, если их там нет."""
+    parts = urlsplit(urljoin(ads_url, url))
+    query = dict(parse_qsl(parts.query, keep_blank_values=True))
+    dashboard_query = dict(parse_qsl(urlsplit(ads_url).query, keep_blank_values=True))
+    for key in _DASHBOARD_PARAMS:
+        if key in dashboard_query and key not in query:
+            query[key] = dashboard_query[key]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+class _StatsDeepLinks:
+    """Шаблон прямой ссылки на статистику группы.
+
+    Шаблон задаётся явно (``{group_id}`` подставляется) или выучивается по
+    первой группе, открытой через поиск: из href кнопки статистики или из
+    адреса страницы после клика. Общий для всех воркеров, поэтому под локом.
+    """
+
+    def __init__(self, ads_url: str, template: str | None = None):
+        self.ads_url = ads_url
+        self.template = template
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _templated(url: str, group_id: str) -> str | None:
+        """*url* с ``{group_id}`` вместо сегментов пути и значений параметров,
+        равных ID целиком; None — таких нет. Цифры ID внутри других значений
+        (ID кабинета, даты) не трогаются."""
+        parts = urlsplit(url)
+        found = False
+
+        def segments(path: str) -> str:
+            nonlocal found
+            result = []
+            for segment in path.split("/"):
+                if segment == group_id:
+                    segment, found = "{group_id}", True
+                result.append(segment)
+            return "/".join(result)
+
+        def params(query: str) -> str:
+            nonlocal found
+            result = []
+            for param in query.split("&") if query else []:
+                key, sep, value = param.partition("=")
+                if sep and value == group_id:
+                    value, found = "{group_id}", True
+                result.append(key + sep + value)
+            return "&".join(result)
+
+        # SPA-маршрут может быть во фрагменте: #/ad_groups/123?tab=…
+        fragment_path, sep, fragment_query = parts.fragment.partition("?")
+        fragment = segments(fragment_path) + sep + params(fragment_query)
+        templated = urlunsplit((parts.scheme, parts.netloc, segments(parts.path), params(parts.query), fragment))
+        return templated if found else None
+
+    def learn(self, url: str | None, group_id: str) -> None:
+        if self.template or not url or not group_id or group_id not in url:
+            return
+        template = self._templated(urljoin(self.ads_url, url), group_id)
+        if template is None:
+            return
+        with self._lock:
+            if self.template:
+                return
+            self.template = template
+            logging.info(f"🔗 Шаблон прямой ссылки на статистику: {self.template}")
+
+    def failed(self) -> None:
+        """Считает неудачные переходы; после нескольких подряд ссылки отключаются."""
+        with self._lock:
+            self.failures += 1
+            if self.failures == _DEEP_LINK_MAX_FAILURES:
+                logging.warning("⚠️  Прямые ссылки не работают – дальше только поиск")
+
+    def succeeded(self) -> None:
+        with self._lock:
+            self.failures = 0
+
+    def url_for(self, group_id: str) -> str | None:
+        if not self.template or self.failures >= _DEEP_LINK_MAX_FAILURES:
+            return None
+        return _with_dashboard_params(self.template.format(group_id=group_id), self.ads_url)
+
+
+def _open_group_stats_deep_link(page, url: str, zoom_level: float) -> bool:
+    """Открывает статистику группы прямой ссылкой, минуя поиск и таблицу."""
+    logging.info(f"🔗 Открываем статистику по прямой ссылке: {url}")
+    try:
+        page.goto(url, timeout=60_000, wait_until="domcontentloaded")
+        # Масштаб сбрасывается при навигации — выставляем заново
+        page.evaluate(f"document.body.style.zoom = '{zoom_level}'")
+    except Exception as e:
+        logging.warning(f"⚠️  Прямая ссылка не открыла статистику: {e}")
+        return False
+    wait_ready(page, "stats")
+    # Спиннер мог не успеть скрыться — решает наличие вкладок статистики
+    if page.locator("#tab_overview").count():
+        return True
+    logging.warning("⚠️  Прямая ссылка не открыла статистику: нет вкладок")
+    return False
+
+
+def _return_to_dashboard(page, ads_url: str, zoom_level: float) -> None:
+    """Возвращает страницу к таблице групп для поиска (после прямых ссылок)."""
+    page.goto(ads_url, timeout=60_000)
+    try:
+        page.wait_for_load_state("networkidle", timeout=10_000)
+    except Exception:
+        logging.warning("⚠️  networkidle не достигнут – продолжаем...")
+    page.evaluate(f"document.body.style.zoom = '{zoom_level}'")
+    wait_ready(page, "dashboard")
+
+
+# ────────────────────────────── group index ─────────────────────────────────
+
+
+# Проходит таблицу групп с прокруткой (строки виртуализированы) и за один
+# вызов собирает для нужных ID название, ссылку и ссылку на статистику.
+# ID строки берётся только из ячейки ID или из ссылки на группу (сегмент пути
+# или параметр *id*): любые другие числа строки — расход, показы — не в счёт.
+_AD_GROUP_INDEX_JS = """
+async ([ids, step]) => {
+    const wanted = new Set(ids);
+    const found = {};
+    const seenRows = new Set();
+    const rowIds = (row, link) => {
+        const result = new Set();
+        for (const cell of row.querySelectorAll("[data-testid='id'], [data-testid$='-id'], [data-testid$='_id']")) {
+            const text = (cell.textContent || "").trim();
+            if (/^\\d+$/.test(text)) result.add(text);
+        }
+        try {
+            const url = new URL(link.getAttribute("href") || "", location.href);
+            for (const segment of url.pathname.split("/")) {
+                if (/^\\d+$/.test(segment)) result.add(segment);
+            }
+            for (const [key, value] of url.searchParams) {
+                if (/id/i.test(key) && /^\\d+$/.test(value)) result.add(value);
+            }
+        } catch (e) {}
+        return result;
+    };
+    // Таблица со своей прокруткой (виртуализированная) прокручивается сама, иначе — окно
+    const scroller = () => {
+        let best = null;
+        for (const el of document.querySelectorAll("[role='grid'], [role='table'], table, div")) {
+            if (el.scrollHeight > el.clientHeight + 50 && (!best || el.scrollHeight > best.scrollHeight)
+                && /(auto|scroll)/.test(getComputedStyle(el).overflowY)
+                && el.querySelector("[data-testid='name-link']")) {
+                best = el;
+            }
+        }
+        return best || document.scrollingElement || document.documentElement;
+    };
+    const collect = () => {
+        for (const link of document.querySelectorAll("[data-testid='name-link']")) {
+            const row = link.closest("tr, [role='row']") || link.parentElement?.parentElement || link;
+            seenRows.add(row.innerText || "");
+            for (const id of rowIds(row, link)) {
+                if (!wanted.has(id) || found[id]) continue;
+                const stats = row.querySelector("a[data-testid='stats'], a[title*='Статистика']");
+                found[id] = {
+                    name: (link.textContent || "").trim(),
+                    href: link.href || null,
+                    stats_href: stats ? stats.href : null,
+                };
+            }
+        }
+    };
+    collect();
+    const box = scroller();
+    for (let y = 0; y < box.scrollHeight && Object.keys(found).length < wanted.size; y += step) {
+        box.scrollTo({top: y, behavior: 'instant'});
+        await new Promise(r => setTimeout(r, 150));
+        collect();
+    }
+    box.scrollTo({top: 0, behavior: 'instant'});
+    return {found, rows: seenRows.size};
+}
+"""
+
+_NEXT_PAGE_SELECTORS = [
+    "[data-testid*='pagination-next']:not([disabled])",
+    "button[aria-label*='Следующая']:not([disabled])",
+    "button[aria-label*='Next']:not([disabled])",
+    "button:has-text('Показать ещё')",
+    "button:has-text('Показать еще')",
+]
+
+
+class _AdGroupIndex:
+    """Индекс ID группы → {name, href, stats_href} по таблице ad_groups.
+
+    Строится один раз на весь прогон первым воркером, остальные ждут его.
+    *complete* — найдены все нужные ID или кнопки следующей страницы нет.
+    Разметка пагинации и прокрутки может отличаться от ожидаемой, поэтому
+    отсутствие ID в индексе значит «неизвестно», и группа ищется поиском.
+    """
+
+    def __init__(self, group_ids, max_pages: int = 50):
+        self.group_ids = [gid for gid in group_ids if gid]
+        self.max_pages = max_pages
+        self.entries: dict[str, dict] = {}
+        self.complete = False
+        self._lock = threading.Lock()
+        self._built = False
+
+    def get(self, group_id: str) -> dict | None:
+        return self.entries.get(group_id)
+
+    def ensure_built(self, page, ads_url: str, zoom_level: float) -> None:
+        with self._lock:
+            if self._built:
+                return
+            self._built = True
+            try:
+                self._build(page, ads_url, zoom_level)
+            except Exception as e:
+                logging.warning(f"⚠️  Не удалось построить индекс групп: {e}")
+                self.complete = False
+
+    def _build(self, page, ads_url: str, zoom_level: float) -> None:
+        started = time.monotonic()
+        paginated = False
+        for page_no in range(1, self.max_pages + 1):
+            result = page.evaluate(_AD_GROUP_INDEX_JS, [self.group_ids, 600])
+            self.entries.update({gid: e for gid, e in result["found"].items() if gid not in self.entries})
+            logging.info(f"🗂️  Индекс групп: страница {page_no}, строк {result['rows']}, найдено {len(self.entries)}/{len(self.group_ids)}")
+            if len(self.entries) >= len(self.group_ids):
+                self.complete = True
+                break
+
+            next_btn, _ = _first_visible(page, None, _NEXT_PAGE_SELECTORS)
+            if next_btn is None:
+                # Кнопки следующей страницы не нашли — дальше не идём
+                self.complete = True
+                break
+            next_btn.click()
+            paginated = True
+            wait_ready(page, "search_results")
+
+        if paginated:
+            _return_to_dashboard(page, ads_url, zoom_level)
+        elapsed = int((time.monotonic() - started) * 1000)
+        logging.info(f"🗂️  Индекс групп построен за {elapsed} мс: {len(self.entries)}/{len(self.group_ids)}"
+                     f"{'' if self.complete else ' (таблица просмотрена не полностью)'}")
+
+
 # ────────────────────────────── main routine ────────────────────────────────
 
 
@@ -641,6 +1152,7 @@ def screenshot_group_stats(
     zoom_level: float = 0.8,
     demography_zoom: float = 0.6,
     geo_zoom: float = 0.8,
+    headless: bool = False,
 ):
     """Save screenshots of *group_name* stats into *output_dir*.
     
@@ -654,6 +1166,7 @@ def screenshot_group_stats(
         zoom_level: Уровень масштабирования страницы (по умолчанию 0.8)
         demography_zoom: Масштаб для демографии (по умолчанию 0.6)
         geo_zoom: Масштаб для географии (по умолчанию 0.8)
+        headless: Запускать браузер без окна
     """
 
     # Убеждаемся, что папка существует
@@ -661,11 +1174,12 @@ def screenshot_group_stats(
     logging.info(f"📁 Папка {output_dir} создана/проверена")
 
     with sync_playwright() as p:
-        browser = p.chromium.launch(headless=False)
+        browser = launch_chromium(p, headless)
         ctx = browser.new_context(
             storage_state="vk_storage.json", viewport={"width": viewport_width, "height": viewport_height}
         )
         page = ctx.new_page()
+        track_requests(page)
 
         print(f"➡️  Opening VK Ads: {ads_url}")
         page.goto(ads_url, timeout=60_000)
@@ -686,12 +1200,12 @@ def screenshot_group_stats(
         
         # Устанавливаем масштаб страницы для лучшего отображения графиков
         page.evaluate(f"document.body.style.zoom = '{zoom_level}'")
-        page.wait_for_timeout(6_000)  # Увеличено в 2 раза
+        wait_ready(page, "dashboard")
 
         # Captcha -----------------------------------------------------------
         if _is_captcha(page):
             logging.warning("🛑 Captcha detected – solve it …")
-            page.wait_for_timeout(30_000)
+            wait_ready(page, "captcha_solved")
             ctx.storage_state(path="vk_storage.json")
 
         # Search ------------------------------------------------------------
@@ -701,8 +1215,6 @@ def screenshot_group_stats(
         # Выполняем поиск
         if not _apply_search_optimized(page, group_name_upper):
             raise RuntimeError(f"❌ Не удалось выполнить поиск для группы: {group_name_upper}")
-        
-        page.wait_for_timeout(4_000)  # Увеличено в 2 раза
 
         # Открытие статистики с автоматической очисткой поиска при ненахождении
         if not _open_group_stats(page, group_name_upper):
@@ -728,9 +1240,9 @@ def screenshot_group_stats(
                 if tab == "geo":
                     # Дополнительное ожидание для географии (карты загружаются дольше)
                     logging.info("⏳ Дополнительное ожидание для загрузки карт...")
-                    page.wait_for_timeout(6_000)  # Увеличено в 2 раза
+                    wait_ready(page, "geo_map")
                 else:
-                    page.wait_for_timeout(2_000)  # Увеличено в 2 раза
+                    wait_ready(page, "tab")
                 logging.info(f"✅ Вкладка {tab} открыта")
             else:
                 logging.warning(f"⚠️  Вкладка '{tab}' не найдена – пропускаем")
@@ -739,19 +1251,9 @@ def screenshot_group_stats(
             if tab == "overview":
                 # Воронка конверсий
                 caption = page.locator("text=Воронка конверсий").first
-                funnel_selectors = [
-                    "div[class*='ConversionsChart'][class*='wrap']",
-                    "div[class^='ConversionsChart_wrap']",
-                    "div[class^='ConversionsChart.module_wrap']",
-                    "div.ConversionsChart\\.module_wrap__XzgxY"
-                ]
-                
-                funnel = None
-                for selector in funnel_selectors:
-                    funnel = page.locator(selector).first
-                    if funnel.count() > 0:
-                        logging.info(f"✅ Найден контейнер воронки: {selector}")
-                        break
+                funnel, selector = _first_present(page, "funnel", _FUNNEL_SELECTORS)
+                if funnel:
+                    logging.info(f"✅ Найден контейнер воронки: {selector}")
                 
                 if caption.count() and funnel and funnel.count():
                     funnel_path = os.path.join(
@@ -783,6 +1285,236 @@ def screenshot_group_stats(
 
         logging.info("✅ Все скриншоты VK Ads созданы успешно")
         browser.close()
+    _SELECTORS.save()
+
+
+_storage_lock = threading.Lock()
+
+
+def _open_ads_dashboard(p, ads_url: str, viewport_width: int, viewport_height: int, zoom_level: float,
+                        headless: bool = False, api_collector=None):
+    """Запускает браузер, открывает дашборд VK Ads и готовит страницу к работе.
+
+    *api_collector* подключается до первой навигации, чтобы поймать
+    JSON-ответы со списком групп. Возвращает (browser, ctx, page).
+    """
+    browser = launch_chromium(p, headless)
+    ctx = browser.new_context(
+        storage_state="vk_storage.json",
+        viewport={"width": viewport_width, "height": viewport_height}
+    )
+    page = ctx.new_page()
+    track_requests(page)
+    if api_collector is not None:
+        api_collector.attach(page)
+
+    logging.info(f"➡️  Открываем VK Ads: {ads_url}")
+    page.goto(ads_url, timeout=60_000)
+
+    try:
+        page.wait_for_load_state("networkidle", timeout=10_000)
+    except Exception:
+        logging.warning("⚠️  networkidle не достигнут – продолжаем...")
+
+    # Обработка первичной авторизации VK ID
+    if not _handle_vk_id_auth(page):
+        logging.warning("⚠️  Возможны проблемы с авторизацией VK ID")
+
+    # Дополнительное ожидание после авторизации
+    try:
+        page.wait_for_load_state("networkidle", timeout=15_000)
+    except Exception:
+        logging.warning("⚠️  networkidle после авторизации не достигнут – продолжаем...")
+
+    # Устанавливаем масштаб страницы
+    page.evaluate(f"document.body.style.zoom = '{zoom_level}'")
+    wait_ready(page, "dashboard")
+
+    # Проверка на капчу
+    if _is_captcha(page):
+        logging.warning("🛑 Обнаружена капча – решите её...")
+        wait_ready(page, "captcha_solved")
+        # Несколько воркеров могут пройти капчу одновременно — пишем файл по очереди
+        with _storage_lock:
+            ctx.storage_state(path="vk_storage.json")
+
+    return browser, ctx, page
+
+
+def _process_group(page, group: dict, idx: int, total: int, output_dir: str, tabs,
+                   demography_zoom: float, geo_zoom: float, clear_search: bool,
+                   ads_url: str, zoom_level: float, deep_links=None, on_tab_done=None,
+                   group_index=None, api_collector=None, capture_mode: str = "element",
+                   pipeline=None, page_state: dict | None = None) -> bool:
+    """Поиск группы, открытие статистики, скриншоты вкладок и закрытие.
+
+    Если известна прямая ссылка на статистику (из *group_index* или
+    *deep_links*), группа открывается по ней без поиска, закрытия и очистки;
+    при неудаче страница возвращается к таблице и используется обычный поиск.
+    *page_state* — состояние страницы воркера между группами: ``dashboard``
+    False, если страница осталась на статистике после прямой ссылки; перед
+    поиском она тогда возвращается к таблице групп.
+    Группы, которых нет в индексе, ищутся обычным поиском. Группы, у которых
+    по данным API (*api_collector*) нет статистики за период, сразу считаются
+    ошибкой.
+    """
+    group_id = group.get("id", "")
+    group_name = group.get("name", "")
+    display_name = group.get("display_name", group_name)
+    if page_state is None:
+        page_state = {"dashboard": True}
+
+    logging.info(f"📊 [{idx}/{total}] Обрабатываем группу: '{display_name}' (ID: {group_id})")
+
+    try:
+        api_entry = api_collector.lookup(group_id) if api_collector is not None else None
+        if api_entry and api_entry["has_stats"] is False:
+            logging.error(f"❌ У группы {group_id} нет статистики за период (по данным API) – пропускаем")
+            return False
+
+        entry = group_index.get(group_id) if group_index is not None else None
+        if group_index is not None and entry is None:
+            logging.info(f"🗂️  Группы {group_id} нет в индексе – ищем через поиск")
+
+        # Ссылка из индекса (--index-groups) открывается и без --deep-link;
+        # счётчик неудач шаблона ведём только для ссылок по шаблону
+        template_links = None
+        if entry and entry.get("stats_href"):
+            deep_url = _with_dashboard_params(entry["stats_href"], ads_url)
+        else:
+            deep_url = deep_links.url_for(group_id) if deep_links else None
+            template_links = deep_links
+        if deep_url:
+            # После перехода страница уже не на таблице групп
+            page_state["dashboard"] = False
+            if _open_group_stats_deep_link(page, deep_url, zoom_level):
+                if template_links:
+                    template_links.succeeded()
+                _create_screenshots_for_group(page, display_name, output_dir, tabs, demography_zoom, geo_zoom,
+                                              on_tab_done, capture_mode, pipeline)
+                logging.info(f"✅ Группа {display_name} обработана успешно (прямая ссылка)")
+                return True
+            if template_links:
+                template_links.failed()
+
+        if not page_state["dashboard"]:
+            # Поле поиска есть только на таблице групп
+            logging.info("↩️  Возвращаемся к поиску в таблице групп")
+            _return_to_dashboard(page, ads_url, zoom_level)
+            page_state["dashboard"] = True
+
+        # Поиск группы по ID
+        if not _apply_search_optimized(page, group_id):
+            logging.error(f"❌ Не удалось выполнить поиск по ID: {group_id}")
+            return False
+
+        # Открытие статистики (ищем по ID, но также можем использовать название как fallback)
+        known_name = entry.get("name") if entry else None
+        if not known_name and api_entry:
+            known_name = api_entry["name"]
+        if not _open_group_stats_by_id(page, group_id, display_name, deep_links, known_name):
+            logging.error(f"❌ Не удалось открыть статистику по ID: {group_id}")
+            return False
+
+        # Создание скриншотов (используем display_name для имен файлов)
+        _create_screenshots_for_group(page, display_name, output_dir, tabs, demography_zoom, geo_zoom,
+                                      on_tab_done, capture_mode, pipeline)
+
+        # Закрытие статистики
+        _close_group_stats(page)
+
+        # Очистка поиска (кроме последней группы)
+        if clear_search:
+            _clear_search(page)
+
+        logging.info(f"✅ Группа {display_name} обработана успешно")
+        return True
+
+    except Exception as e:
+        logging.error(f"❌ Ошибка при обработке группы {display_name}: {e}")
+
+        # Пытаемся закрыть статистику в случае ошибки
+        try:
+            _close_group_stats(page)
+        except:
+            pass
+        # Где осталась страница, неизвестно — следующий поиск начнём с таблицы
+        page_state["dashboard"] = False
+        return False
+
+
+def _group_cache_keys(cache, group: dict, tabs, cache_params: tuple) -> dict:
+    """Ключи кэша по вкладкам группы: ID, вкладка, период, окно, масштаб вкладки и режим съёмки."""
+    date_range, viewport, tab_zoom, capture_mode = cache_params
+    return {
+        tab: cache.key("ads", group.get("id", ""), tab, date_range, viewport, tab_zoom.get(tab, 1.0),
+                       capture_mode)
+        for tab in tabs or ("overview",)
+    }
+
+
+def _fetch_cached_group(cache, group: dict, output_dir: str, tabs, cache_params: tuple) -> bool:
+    """Восстанавливает все вкладки группы из кэша. False — хотя бы одной нет."""
+    name = group.get("display_name", group.get("name", ""))
+    keys = _group_cache_keys(cache, group, tabs, cache_params)
+    return all(cache.fetch(key, _tab_output_path(output_dir, name, tab)) for tab, key in keys.items())
+
+
+def _tab_saved(cache, journal, manifest, group: dict, cache_params: tuple, tab: str, path: str | None,
+               on_tab_saved=None) -> None:
+    """Вкладка группы обработана: отметка в журнале и манифесте, запись готового файла в кэш.
+
+    *on_tab_saved* (group, tab, path) вызывается для каждого записанного файла.
+    """
+    if journal is not None:
+        journal.mark_tab(group.get("id", ""), tab, path)
+    if manifest is not None:
+        manifest.record(group.get("id", ""), group.get("display_name", group.get("name", "")), tab, path)
+    if cache is not None and path:
+        cache.put(_group_cache_keys(cache, group, (tab,), cache_params)[tab], path)
+    if on_tab_saved is not None and path:
+        on_tab_saved(group, tab, path)
+
+
+def _groups_worker(jobs, results: dict, total: int, output_dir: str, ads_url: str, tabs,
+                   viewport_width: int, viewport_height: int, zoom_level: float,
+                   demography_zoom: float, geo_zoom: float, deep_links=None, headless: bool = False,
+                   cache=None, cache_params: tuple = (), journal=None, group_index=None,
+                   api_collector=None, capture_mode: str = "element", pipeline=None, manifest=None,
+                   on_tab_saved=None):
+    """Разбирает группы из очереди *jobs* на своей странице VK Ads.
+
+    Результат по каждой группе пишется в *results* под её порядковым номером.
+    """
+    with sync_playwright() as p:
+        browser, ctx, page = _open_ads_dashboard(
+            p, ads_url, viewport_width, viewport_height, zoom_level, headless, api_collector,
+        )
+        # Страница открыта на таблице групп; _process_group следит, где она сейчас
+        page_state = {"dashboard": True}
+        try:
+            if group_index is not None:
+                group_index.ensure_built(page, ads_url, zoom_level)
+            while True:
+                try:
+                    idx, group, group_tabs = jobs.get_nowait()
+                except queue.Empty:
+                    break
+                # Журнал, манифест и кэш обновляются по мере записи файлов вкладок
+                on_tab_done = None
+                if journal is not None or cache is not None or manifest is not None or on_tab_saved is not None:
+                    on_tab_done = lambda tab, path, group=group: _tab_saved(
+                        cache, journal, manifest, group, cache_params, tab, path, on_tab_saved,
+                    )
+                results[idx] = _process_group(
+                    page, group, idx, total, output_dir, group_tabs,
+                    demography_zoom, geo_zoom, clear_search=not jobs.empty(),
+                    ads_url=ads_url, zoom_level=zoom_level, deep_links=deep_links,
+                    on_tab_done=on_tab_done, group_index=group_index, api_collector=api_collector,
+                    capture_mode=capture_mode, pipeline=pipeline, page_state=page_state,
+                )
+        finally:
+            browser.close()
 
 
 def screenshot_multiple_groups_stats(
@@ -795,8 +1527,20 @@ def screenshot_multiple_groups_stats(
     zoom_level: float = 0.8,
     demography_zoom: float = 0.6,
     geo_zoom: float = 0.8,
+    workers: int = 1,
+    deep_link: bool = False,
+    stats_url_template: str | None = None,
+    headless: bool = False,
+    cache=None,
+    journal=None,
+    preflight_index: bool = False,
+    intercept_api: bool = False,
+    capture_mode: str = "element",
+    pipeline=None,
+    manifest=None,
+    on_tab_saved=None,
 ):
-    """Оптимизированная функция для скриншотов нескольких групп в одном браузере.
+    """Оптимизированная функция для скриншотов нескольких групп.
     
     Args:
         groups: Список словарей {"id": "118746396", "name": "ЦР25_...", "display_name": "..."}
@@ -808,96 +1552,109 @@ def screenshot_multiple_groups_stats(
         zoom_level: Уровень масштабирования страницы
         demography_zoom: Масштаб для демографии
         geo_zoom: Масштаб для географии
+        workers: Сколько страниц VK Ads обрабатывают группы параллельно
+            (у каждой свой браузер с сессией из vk_storage.json)
+        deep_link: Открывать статистику прямой ссылкой вместо поиска по таблице;
+            поиск остаётся запасным вариантом
+        stats_url_template: Шаблон прямой ссылки с ``{group_id}``; если не задан,
+            выучивается по первой группе, открытой через поиск
+        headless: Запускать браузеры без окна
+        cache: ScreenshotCache; группы, у которых все вкладки есть в кэше,
+            не открываются в браузере
+        journal: RunJournal; обработанные вкладки отмечаются в нём, а уже
+            отмеченные в прошлых запусках пропускаются
+        preflight_index: Перед обработкой один раз пройти таблицу ad_groups и
+            построить индекс ID → название/ссылки для всех нужных групп
+        intercept_api: Слушать JSON-ответы дашборда: названия групп и наличие
+            статистики берутся из них, группы без статистики отсеиваются без
+            кликов; собранные данные сохраняются в output_dir/ads_api_cache.json
+        capture_mode: element — скриншоты по элементам с прокруткой; crop — один
+            снимок вкладки и вырезка воронки/демографии/географии через PIL
+            (с откатом на element, если область не удалось вырезать)
+        pipeline: ImagePipeline; вырезка в режиме crop идёт в фоновых процессах,
+            файлы вкладок готовы после ``pipeline.close()``
+        manifest: CaptureManifest; каждый готовый файл вкладки записывается в
+            него (ID, вкладка, путь, размеры, хэш). Сохраняет манифест вызывающий
+            код — после ``pipeline.close()``
+        on_tab_saved: Вызывается как ``on_tab_saved(group, tab, path)`` для каждого
+            записанного файла вкладки (в том числе взятого из кэша) — из потоков
+            воркеров или пула обработки изображений
     """
     _safe_mkdir(output_dir)
     logging.info(f"📁 Папка {output_dir} создана/проверена")
-    
-    successful_groups = []
-    failed_groups = []
-    
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=False)
-        ctx = browser.new_context(
-            storage_state="vk_storage.json", 
-            viewport={"width": viewport_width, "height": viewport_height}
-        )
-        page = ctx.new_page()
-        
-        logging.info(f"➡️  Открываем VK Ads: {ads_url}")
-        page.goto(ads_url, timeout=60_000)
-        
-        try:
-            page.wait_for_load_state("networkidle", timeout=10_000)
-        except Exception:
-            logging.warning("⚠️  networkidle не достигнут – продолжаем...")
-        
-        # Обработка первичной авторизации VK ID
-        if not _handle_vk_id_auth(page):
-            logging.warning("⚠️  Возможны проблемы с авторизацией VK ID")
-        
-        # Дополнительное ожидание после авторизации
-        try:
-            page.wait_for_load_state("networkidle", timeout=15_000)
-        except Exception:
-            logging.warning("⚠️  networkidle после авторизации не достигнут – продолжаем...")
-        
-        # Устанавливаем масштаб страницы
-        page.evaluate(f"document.body.style.zoom = '{zoom_level}'")
-        page.wait_for_timeout(6_000)
-        
-        # Проверка на капчу
-        if _is_captcha(page):
-            logging.warning("🛑 Обнаружена капча – решите её...")
-            page.wait_for_timeout(30_000)
-            ctx.storage_state(path="vk_storage.json")
-        
-        # Обрабатываем каждую группу
-        for idx, group in enumerate(groups, 1):
-            group_id = group.get("id", "")
-            group_name = group.get("name", "")
-            display_name = group.get("display_name", group_name)
-            
-            logging.info(f"📊 [{idx}/{len(groups)}] Обрабатываем группу: '{display_name}' (ID: {group_id})")
-            
-            try:
-                # Поиск группы по ID
-                if not _apply_search_optimized(page, group_id):
-                    logging.error(f"❌ Не удалось выполнить поиск по ID: {group_id}")
-                    failed_groups.append(group)
-                    continue
-                
-                page.wait_for_timeout(4_000)
-                
-                # Открытие статистики (ищем по ID, но также можем использовать название как fallback)
-                if not _open_group_stats_by_id(page, group_id, display_name):
-                    logging.error(f"❌ Не удалось открыть статистику по ID: {group_id}")
-                    failed_groups.append(group)
-                    continue
-                
-                # Создание скриншотов (используем display_name для имен файлов)
-                _create_screenshots_for_group(page, display_name, output_dir, tabs, demography_zoom, geo_zoom)
-                
-                # Закрытие статистики
-                _close_group_stats(page)
-                
-                # Очистка поиска (кроме последней группы)
-                if idx < len(groups):
-                    _clear_search(page)
-                
-                successful_groups.append(group)
-                logging.info(f"✅ Группа {display_name} обработана успешно")
-                
-            except Exception as e:
-                logging.error(f"❌ Ошибка при обработке группы {display_name}: {e}")
-                failed_groups.append(group)
-                
-                # Пытаемся закрыть статистику в случае ошибки
+
+    results: dict[int, bool] = {}
+    cache_params = (
+        date_range_from_url(ads_url),
+        (viewport_width, viewport_height),
+        {"overview": zoom_level, "demography": demography_zoom, "geo": geo_zoom},
+        capture_mode,
+    )
+
+    jobs = queue.Queue()
+    for idx, group in enumerate(groups, 1):
+        group_tabs = tuple(tabs or ("overview",))
+        if journal is not None:
+            done_tabs = journal.group_tabs_done(group.get("id", ""))
+            group_tabs = tuple(tab for tab in group_tabs if tab not in done_tabs)
+            # Манифест сохраняется только в конце прогона: после сбоя файлы из
+            # журнала в нём могут отсутствовать, поэтому записываем их заново
+            for tab, path in done_tabs.items():
+                if tab in (tabs or ("overview",)):
+                    _tab_saved(None, None, manifest, group, cache_params, tab, path, on_tab_saved)
+            if not group_tabs:
+                logging.info(f"📒 [{idx}/{len(groups)}] Группа '{group.get('display_name', '')}' уже готова (журнал)")
+                results[idx] = True
+                continue
+        if cache is not None and _fetch_cached_group(cache, group, output_dir, tabs, cache_params):
+            logging.info(f"💾 [{idx}/{len(groups)}] Группа '{group.get('display_name', '')}' взята из кэша")
+            name = group.get("display_name", group.get("name", ""))
+            for tab in tabs or ("overview",):
+                _tab_saved(None, journal, manifest, group, cache_params, tab,
+                           _tab_output_path(output_dir, name, tab), on_tab_saved)
+            results[idx] = True
+            continue
+        jobs.put((idx, group, group_tabs))
+    if cache is not None:
+        cache.save()
+
+    deep_links = _StatsDeepLinks(ads_url, stats_url_template) if deep_link else None
+    group_index = None
+    if preflight_index and not jobs.empty():
+        group_index = _AdGroupIndex([job[1].get("id", "") for job in list(jobs.queue)])
+    api_collector = AdsResponseCollector() if intercept_api else None
+    worker_args = (
+        jobs, results, len(groups), output_dir, ads_url, tabs,
+        viewport_width, viewport_height, zoom_level, demography_zoom, geo_zoom, deep_links, headless,
+        cache, cache_params, journal, group_index, api_collector, capture_mode, pipeline, manifest,
+        on_tab_saved,
+    )
+    workers = max(1, min(workers, jobs.qsize()))
+
+    if jobs.empty():
+        logging.info("💾 Все группы уже готовы (кэш/журнал), браузер не нужен")
+    elif workers == 1:
+        _groups_worker(*worker_args)
+    else:
+        logging.info(f"🧵 Обрабатываем группы на {workers} страницах параллельно")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ads") as pool:
+            futures = [pool.submit(_groups_worker, *worker_args) for _ in range(workers)]
+            for future in futures:
                 try:
-                    _close_group_stats(page)
-                except:
-                    pass
-        
-        browser.close()
+                    future.result()
+                except Exception as e:
+                    # Группы упавшего воркера остаются в очереди и достаются остальным
+                    logging.error(f"❌ Воркер VK Ads завершился с ошибкой: {e}")
+
+    _SELECTORS.save()
+    if cache is not None:
+        cache.save()
+    if api_collector is not None and api_collector.groups:
+        api_collector.save(os.path.join(output_dir, "ads_api_cache.json"))
+
+    # Сохраняем исходный порядок групп; необработанные считаем ошибками
+    successful_groups = [g for idx, g in enumerate(groups, 1) if results.get(idx)]
+    failed_groups = [g for idx, g in enumerate(groups, 1) if not results.get(idx)]
     
     logging.info(f"🏁 Обработка завершена. Успешно: {len(successful_groups)}, Ошибки: {len(failed_groups)}")
     if failed_groups:
@@ -910,41 +1667,26 @@ def _apply_search_optimized(page, query: str) -> bool:
     """Оптимизированный поиск с логированием."""
     logging.info(f"🔍 Поиск рекламного плана: '{query}'")
     
-    search_selectors = [
-        "input[type='search']",
-        "input[placeholder*='Поиск']",
-        "input[placeholder*='поиск']",
-        "[data-testid*='search'] input",
-        ".search input",
-        "input[name*='search']",
-    ]
-    
-    inp = None
-    for selector in search_selectors:
-        inp = page.locator(selector).first
-        if inp.count() > 0:
-            logging.info(f"✅ Найдено поле поиска: {selector}")
-            break
-    
-    if not inp or inp.count() == 0:
+    inp, selector = _first_present(page, "search_input", _SEARCH_INPUT_SELECTORS)
+    if inp:
+        logging.info(f"✅ Найдено поле поиска: {selector}")
+    else:
         logging.error("❌ Поле поиска не найдено")
         return False
     
     try:
         inp.click()
-        page.wait_for_timeout(1000)
+        pause(page, 300)
         inp.fill("")
-        page.wait_for_timeout(600)
         inp.fill(query)
-        page.wait_for_timeout(1000)
         page.keyboard.press("Enter")
-        page.wait_for_timeout(4_000)
+        wait_ready(page, "search_results")
         
         # Проверяем наличие опции "содержит"
         contains = page.locator("[data-testid='search-contains-menu-item']").first
         if contains.count():
             contains.click()
-            page.wait_for_timeout(2_000)
+            wait_ready(page, "search_results")
             logging.info("✅ Выбран вариант 'содержит'")
         
         return True
@@ -954,8 +1696,14 @@ def _apply_search_optimized(page, query: str) -> bool:
         return False
 
 
-def _open_group_stats_by_id(page, group_id: str, display_name: str = "") -> bool:
-    """Открывает статистику для указанной группы по ID."""
+def _open_group_stats_by_id(page, group_id: str, display_name: str = "", deep_links=None,
+                            known_name: str | None = None) -> bool:
+    """Открывает статистику для указанной группы по ID.
+
+    Попутно передаёт в *deep_links* адрес статистики, чтобы следующие группы
+    открывались прямой ссылкой. *known_name* — точное название из индекса
+    групп: по нему ссылка ищется одним запросом без перебора.
+    """
     logging.info(f"🔍 Ищем рекламный план по ID '{group_id}' (название: '{display_name}') в таблице...")
     
     # Сначала пытаемся найти по ID, если не получается - по названию
@@ -965,8 +1713,18 @@ def _open_group_stats_by_id(page, group_id: str, display_name: str = "") -> bool
     
     link = None
     found_text = ""
+
+    if known_name:
+        candidate = page.locator("[data-testid='name-link']", has_text=known_name).first
+        try:
+            candidate.wait_for(state="visible", timeout=5_000)
+            link = candidate
+            found_text = known_name
+            logging.info(f"✅ Найден план из индекса: '{found_text}'")
+        except Exception:
+            logging.warning(f"⚠️  План '{known_name}' из индекса не виден, ищем перебором")
     
-    for pattern in search_patterns:
+    for pattern in ([] if link else search_patterns):
         logging.info(f"🔍 Поиск по паттерну: '{pattern}'")
         
         link_selectors = [
@@ -1008,39 +1766,20 @@ def _open_group_stats_by_id(page, group_id: str, display_name: str = "") -> bool
     
     try:
         row.scroll_into_view_if_needed(timeout=20_000)
-        page.wait_for_timeout(800)
+        pause(page, 800)
     except Exception as e:
         logging.warning(f"⚠️  Ошибка при прокрутке к строке: {e}")
     
     # Ховерим строку для появления кнопок
     try:
         row.hover(timeout=10_000)
-        page.wait_for_timeout(600)
+        pause(page, 600)
         logging.info("🖱️  Навели курсор на строку плана")
     except Exception as e:
         logging.warning(f"⚠️  Не удалось навести курсор на строку: {e}")
     
     # Поиск кнопки статистики
     logging.info("📊 Открываем статистику...")
-    stats_selectors = [
-        "a[data-testid='stats']",
-        "[data-testid='stats']",
-        "button[title*='Статистика']",
-        "a[title*='Статистика']",
-        "svg.vkuiIcon--poll_outline_20",
-        "svg[class*='poll_outline']",
-        "svg[aria-label*='Статистика']",
-        "button:has(svg[class*='poll_outline'])",
-    ]
-    
-    def _find_stats_button(scope):
-        for sel in stats_selectors:
-            btn = scope.locator(sel).first
-            if btn.count() > 0:
-                logging.info(f"✅ Найдена кнопка статистики: {sel}")
-                return btn
-        return None
-    
     btn = _find_stats_button(row) or _find_stats_button(page)
     if not btn:
         logging.error("❌ Кнопка статистики не найдена")
@@ -1048,12 +1787,22 @@ def _open_group_stats_by_id(page, group_id: str, display_name: str = "") -> bool
         _clear_search(page)
         return False
     
+    if deep_links is not None and not deep_links.template:
+        try:
+            href = btn.locator("xpath=ancestor-or-self::a[1]").first.get_attribute("href", timeout=1_000)
+            deep_links.learn(href, group_id)
+        except Exception:
+            pass
+
     try:
+        url_before = page.url
         btn.scroll_into_view_if_needed()
-        page.wait_for_timeout(500)
+        pause(page, 500)
         btn.click()
-        page.wait_for_timeout(3_000)
+        wait_ready(page, "stats")
         logging.info(f"✅ Статистика для '{found_text}' открыта")
+        if deep_links is not None and page.url != url_before:
+            deep_links.learn(page.url, group_id)
         return True
     except Exception as e:
         logging.error(f"❌ Ошибка при клике по кнопке статистики: {e}")
@@ -1092,39 +1841,20 @@ def _open_group_stats(page, group_name_upper: str) -> bool:
     
     try:
         row.scroll_into_view_if_needed(timeout=20_000)
-        page.wait_for_timeout(800)
+        pause(page, 800)
     except Exception as e:
         logging.warning(f"⚠️  Ошибка при прокрутке к строке: {e}")
     
     # Ховерим строку для появления кнопок
     try:
         row.hover(timeout=10_000)
-        page.wait_for_timeout(600)
+        pause(page, 600)
         logging.info("🖱️  Навели курсор на строку плана")
     except Exception as e:
         logging.warning(f"⚠️  Не удалось навести курсор на строку: {e}")
     
     # Поиск кнопки статистики
     logging.info("📊 Открываем статистику...")
-    stats_selectors = [
-        "a[data-testid='stats']",
-        "[data-testid='stats']",
-        "button[title*='Статистика']",
-        "a[title*='Статистика']",
-        "svg.vkuiIcon--poll_outline_20",
-        "svg[class*='poll_outline']",
-        "svg[aria-label*='Статистика']",
-        "button:has(svg[class*='poll_outline'])",
-    ]
-    
-    def _find_stats_button(scope):
-        for sel in stats_selectors:
-            btn = scope.locator(sel).first
-            if btn.count() > 0:
-                logging.info(f"✅ Найдена кнопка статистики: {sel}")
-                return btn
-        return None
-    
     btn = _find_stats_button(row) or _find_stats_button(page)
     if not btn:
         logging.error("❌ Кнопка статистики не найдена")
@@ -1134,7 +1864,7 @@ def _open_group_stats(page, group_name_upper: str) -> bool:
     
     try:
         btn.click()
-        page.wait_for_timeout(8_000)
+        wait_ready(page, "stats")
         logging.info("✅ Статистика открыта")
         return True
     except Exception as e:
@@ -1144,8 +1874,24 @@ def _open_group_stats(page, group_name_upper: str) -> bool:
         return False
 
 
-def _create_screenshots_for_group(page, group_name_upper: str, output_dir: str, tabs, demography_zoom: float, geo_zoom: float):
-    """Создает скриншоты для всех вкладок группы."""
+def _tab_output_path(output_dir: str, group_name: str, tab: str) -> str:
+    """Путь к скриншоту вкладки: для overview сохраняется воронка конверсий."""
+    if tab == "overview":
+        return os.path.join(output_dir, f"{group_name}_overview_funnel.png")
+    return os.path.join(output_dir, f"{group_name}_{tab}.png")
+
+
+def _create_screenshots_for_group(page, group_name_upper: str, output_dir: str, tabs, demography_zoom: float, geo_zoom: float,
+                                  on_tab_done=None, capture_mode: str = "element", pipeline=None):
+    """Создает скриншоты для всех вкладок группы.
+
+    После каждой обработанной вкладки вызывает ``on_tab_done(tab, path)``;
+    *path* — None, если скриншот вкладки не получился. В режиме
+    *capture_mode* = "crop" воронка, демография и география вырезаются из
+    одного снимка вкладки (в *pipeline*, если он передан — тогда
+    ``on_tab_done`` вызывается после записи файла).
+    """
+    tab_zoom = {"overview": 1.0, "demography": demography_zoom, "geo": geo_zoom}
     _safe_mkdir(output_dir)
 
     # Ждём появления вкладок статистики (до 10 сек)
@@ -1163,63 +1909,69 @@ def _create_screenshots_for_group(page, group_name_upper: str, output_dir: str,
             tab_btn.click()
             if tab == "geo":
                 logging.info("⏳ Дополнительное ожидание для загрузки карт...")
-                page.wait_for_timeout(6_000)
+                wait_ready(page, "geo_map")
             else:
-                page.wait_for_timeout(2_000)
+                wait_ready(page, "tab")
             logging.info(f"✅ Вкладка {tab} открыта")
         else:
             logging.warning(f"⚠️  Вкладка '{tab}' не найдена – пропускаем")
             continue
-        
+
+        # Файл прошлого прогона убираем: готовой вкладка считается, только
+        # если этот прогон записал файл заново
+        tab_path = _tab_output_path(output_dir, group_name_upper, tab)
+        try:
+            os.remove(tab_path)
+        except FileNotFoundError:
+            pass
+
+        if capture_mode == "crop" and tab in _CROP_REGIONS:
+            on_saved = None
+            if on_tab_done is not None:
+                on_saved = lambda tab=tab, tab_path=tab_path: on_tab_done(tab, tab_path)
+            if _shot_tab_cropped(page, tab, tab_path, tab_zoom[tab], pipeline, on_saved):
+                # on_tab_done уже вызван или будет вызван после записи файла
+                continue
+
         if tab == "overview":
             # Воронка конверсий
             caption = page.locator("text=Воронка конверсий").first
-            funnel_selectors = [
-                "div[class*='ConversionsChart'][class*='wrap']",
-                "div[class^='ConversionsChart_wrap']", 
-                "div[class^='ConversionsChart.module_wrap']",
-                "div.ConversionsChart\\.module_wrap__XzgxY"
-            ]
-            
-            funnel = None
-            for selector in funnel_selectors:
-                funnel = page.locator(selector).first
-                if funnel.count() > 0:
-                    logging.info(f"✅ Найден контейнер воронки: {selector}")
-                    break
+            funnel, selector = _first_present(page, "funnel", _FUNNEL_SELECTORS)
+            if funnel:
+                logging.info(f"✅ Найден контейнер воронки: {selector}")
             
             if caption.count() and funnel and funnel.count():
-                funnel_path = os.path.join(output_dir, f"{group_name_upper}_overview_funnel.png")
+                funnel_path = _tab_output_path(output_dir, group_name_upper, tab)
                 _shot_with_caption(page, caption, funnel, funnel_path)
                 logging.info(f"✅ Воронка сохранена: {funnel_path}")
             else:
                 logging.warning(f"⚠️  Воронка конверсий не найдена для группы {group_name_upper}")
                 
         elif tab == "demography":
-            tab_path = os.path.join(output_dir, f"{group_name_upper}_{tab}.png")
+            tab_path = _tab_output_path(output_dir, group_name_upper, tab)
             _safe_mkdir(output_dir)
             _shot_demography_section(page, tab_path, demography_zoom)
             
         elif tab == "geo":
-            tab_path = os.path.join(output_dir, f"{group_name_upper}_{tab}.png")
+            tab_path = _tab_output_path(output_dir, group_name_upper, tab)
             _safe_mkdir(output_dir)
             _shot_geo_section(page, tab_path, geo_zoom)
             
         elif tab != "overview":
             _scroll_to_bottom(page)
-            tab_path = os.path.join(output_dir, f"{group_name_upper}_{tab}.png")
+            tab_path = _tab_output_path(output_dir, group_name_upper, tab)
             _safe_mkdir(output_dir)
             page.screenshot(path=tab_path, full_page=True)
             logging.info(f"✅ Скриншот вкладки сохранён: {tab_path}")
 
+        if on_tab_done is not None:
+            on_tab_done(tab, tab_path if os.path.exists(tab_path) else None)
+
 
 def _close_group_stats(page):
     """Закрывает статистику группы по крестику."""
     logging.info("🔄 Закрываем статистику...")
     
-    # Ждем стабилизации страницы
-    page.wait_for_timeout(1000)
-    
     # Сначала пытаемся убрать overlay, который может блокировать клик
     try:
         overlay_selectors = [
@@ -1227,70 +1979,19 @@ def _close_group_stats(page):
             "[class*='overlay']",
             "[class*='backdrop']"
         ]
-        for overlay_selector in overlay_selectors:
-            overlay = page.locator(overlay_selector).first
-            if overlay.count() > 0:
-                logging.info(f"🔍 Найден блокирующий overlay: {overlay_selector}")
-                # Скрываем overlay через CSS
-                page.evaluate(f"document.querySelector('{overlay_selector}').style.display = 'none'")
-                page.wait_for_timeout(500)
-                break
+        _, overlay_selector = probe(page, overlay_selectors).first_present(overlay_selectors)
+        if overlay_selector:
+            logging.info(f"🔍 Найден блокирующий overlay: {overlay_selector}")
+            # Скрываем overlay через CSS
+            page.evaluate(f"document.querySelector('{overlay_selector}').style.display = 'none'")
     except Exception as e:
         logging.debug(f"Не удалось убрать overlay: {e}")
     
-    # Более точные селекторы для кнопки закрытия (добавлен cancel_16)
-    close_selectors = [
-        # Точные селекторы для SVG с cancel (24 и 16)
-        "svg.vkuiIcon--cancel_24",
-        "svg.vkuiIcon--cancel_16", 
-        "svg[class*='vkuiIcon--cancel_24']",
-        "svg[class*='vkuiIcon--cancel_16']",
-        "svg[class*='cancel_24']",
-        "svg[class*='cancel_16']",
-        # Кнопки, содержащие этот SVG
-        "button:has(svg.vkuiIcon--cancel_24)",
-        "button:has(svg.vkuiIcon--cancel_16)",
-        "button:has(svg[class*='cancel_24'])",
-        "button:has(svg[class*='cancel_16'])",
-        "[role='button']:has(svg[class*='cancel_24'])",
-        "[role='button']:has(svg[class*='cancel_16'])",
-        # Родительские элементы с aria-label
-        "button[aria-label*='Закрыть']",
-        "button[aria-label*='закрыть']", 
-        "button[aria-label*='Close']",
-        "button[aria-label*='close']",
-        # По data-testid
-        "[data-testid*='close']",
-        "[data-testid*='Close']",
-        # Общие селекторы для модальных окон
-        ".modal-close",
-        ".close-button",
-        ".dialog-close",
-        # Поиск по viewBox SVG
-        "svg[viewBox='0 0 24 24']:has(use[xlink:href='#cancel_24'])",
-        "svg[viewBox='0 0 16 16']:has(use[xlink:href='#cancel_16'])",
-        "button:has(svg[viewBox='0 0 24 24']:has(use[xlink:href='#cancel_24']))",
-        "button:has(svg[viewBox='0 0 16 16']:has(use[xlink:href='#cancel_16']))"
-    ]
-    
-    close_btn = None
-    found_selector = None
     
     # Ищем кнопку закрытия
-    for selector in close_selectors:
-        try:
-            elements = page.locator(selector).all()
-            for element in elements:
-                if element.is_visible():
-                    close_btn = element
-                    found_selector = selector
-                    logging.info(f"✅ Найдена видимая кнопка закрытия: {selector}")
-                    break
-            if close_btn:
-                break
-        except Exception as e:
-            logging.debug(f"Ошибка при поиске по селектору '{selector}': {e}")
-            continue
+    close_btn, found_selector = _first_visible(page, None, _CLOSE_SELECTORS)
+    if close_btn:
+        logging.info(f"✅ Найдена видимая кнопка закрытия: {found_selector}")
     
     if not close_btn:
         logging.warning("⚠️  Кнопка закрытия статистики не найдена, пробуем альтернативные методы...")
@@ -1303,9 +2004,9 @@ def _close_group_stats(page):
     try:
         logging.info(f"🖱️  Пробуем принудительный клик по: {found_selector}")
         close_btn.scroll_into_view_if_needed()
-        page.wait_for_timeout(500)
+        pause(page, 500)
         close_btn.click(force=True, timeout=5000)
-        page.wait_for_timeout(2000)
+        wait_ready(page, "stats_closed")
         logging.info("✅ Статистика закрыта (принудительный клик)")
         success = True
     except Exception as e:
@@ -1316,7 +2017,7 @@ def _close_group_stats(page):
         try:
             logging.info(f"🖱️  Пробуем обычный клик по: {found_selector}")
             close_btn.click(timeout=5000)
-            page.wait_for_timeout(2000)
+            wait_ready(page, "stats_closed")
             logging.info("✅ Статистика закрыта (обычный клик)")
             success = True
         except Exception as e:
@@ -1327,7 +2028,7 @@ def _close_group_stats(page):
         try:
             logging.info("🖱️  Пробуем принудительный клик через JS...")
             page.evaluate("element => element.click()", close_btn.element_handle())
-            page.wait_for_timeout(2000)
+            wait_ready(page, "stats_closed")
             logging.info("✅ Статистика закрыта (JS клик)")
             success = True
         except Exception as e:
@@ -1344,7 +2045,7 @@ def _close_group_stats(page):
                     cancelable: true
                 }))
             """, close_btn.element_handle())
-            page.wait_for_timeout(2000)
+            wait_ready(page, "stats_closed")
             logging.info("✅ Статистика закрыта (dispatchEvent)")
             success = True
         except Exception as e:
@@ -1359,7 +2060,7 @@ def _close_group_stats(page):
                 x = bbox['x'] + bbox['width'] / 2
                 y = bbox['y'] + bbox['height'] / 2
                 page.mouse.click(x, y)
-                page.wait_for_timeout(2000)
+                wait_ready(page, "stats_closed")
                 logging.info("✅ Статистика закрыта (клик по координатам)")
                 success = True
         except Exception as e:
@@ -1380,7 +2081,7 @@ def _close_stats_fallback(page):
     try:
         logging.info("⌨️  Пробуем ESC...")
         page.keyboard.press("Escape")
-        page.wait_for_timeout(2000)
+        wait_ready(page, "stats_closed")
         logging.info("✅ Попытка закрытия через ESC")
         return True
     except Exception as e:
@@ -1397,13 +2098,12 @@ def _close_stats_fallback(page):
             "[class*='backdrop']"
         ]
         
-        for selector in overlay_selectors:
-            overlay = page.locator(selector).first
-            if overlay.count() > 0:
-                overlay.click()
-                page.wait_for_timeout(2000)
-                logging.info(f"✅ Закрыто через overlay: {selector}")
-                return True
+        overlay, selector = probe(page, overlay_selectors).first_present(overlay_selectors)
+        if overlay:
+            overlay.click()
+            wait_ready(page, "stats_closed")
+            logging.info(f"✅ Закрыто через overlay: {selector}")
+            return True
     except Exception as e:
         logging.warning(f"⚠️  Клик по overlay не сработал: {e}")
     
@@ -1419,13 +2119,12 @@ def _close_stats_fallback(page):
             "a:has-text('Закрыть')"
         ]
         
-        for selector in close_text_selectors:
-            btn = page.locator(selector).first
-            if btn.count() > 0 and btn.is_visible():
-                btn.click()
-                page.wait_for_timeout(2000)
-                logging.info(f"✅ Закрыто через текстовую кнопку: {selector}")
-                return True
+        btn, selector = probe(page, close_text_selectors).first_visible(close_text_selectors)
+        if btn:
+            btn.click()
+            wait_ready(page, "stats_closed")
+            logging.info(f"✅ Закрыто через текстовую кнопку: {selector}")
+            return True
     except Exception as e:
         logging.warning(f"⚠️  Поиск текстовых кнопок не сработал: {e}")
     
@@ -1433,7 +2132,7 @@ def _close_stats_fallback(page):
     try:
         logging.info("⬅️  Пробуем вернуться назад...")
         page.go_back()
-        page.wait_for_timeout(3000)
+        wait_ready(page, "dashboard")
         logging.info("✅ Возврат назад выполнен")
         return True
     except Exception as e:
@@ -1447,51 +2146,11 @@ def _clear_search(page):
     """Очищает поле поиска по крестику."""
     logging.info("🧹 Очищаем поиск...")
     
-    # Ищем крестик для очистки поиска (SVG с cancel_16)
-    clear_selectors = [
-        # Точные селекторы для VK cancel_16 SVG из вашего примера
-        "svg.vkuiIcon--cancel_16",
-        "svg[class*='vkuiIcon--cancel_16']",
-        "svg[class*='vkuiIcon vkuiIcon--16 vkuiIcon--w-16 vkuiIcon--h-16 vkuiIcon--cancel_16']",
-        "svg.vkuiIcon--16.vkuiIcon--cancel_16",
-        # SVG с use и xlink:href для cancel_16
-        "svg:has(use[xlink:href='#cancel_16'])",
-        "svg[viewBox='0 0 16 16']:has(use[xlink:href='#cancel_16'])",
-        # Кнопки, содержащие эти SVG
-        "button:has(svg.vkuiIcon--cancel_16)",
-        "button:has(svg[class*='cancel_16'])",
-        "button:has(svg:has(use[xlink:href='#cancel_16']))",
-        "[role='button']:has(svg[class*='cancel_16'])",
-        # Дополнительные селекторы
-        "[data-testid*='clear']",
-        "[data-testid*='search-clear']",
-        "input[type='search'] + button",
-        ".search-clear",
-        # Поиск по aria-label
-        "button[aria-label*='очистить']",
-        "button[aria-label*='Очистить']",
-        "button[aria-label*='clear']",
-        "button[aria-label*='Clear']"
-    ]
-    
-    clear_btn = None
-    found_selector = None
     
     # Ищем видимую кнопку очистки
-    for selector in clear_selectors:
-        try:
-            elements = page.locator(selector).all()
-            for element in elements:
-                if element.is_visible():
-                    clear_btn = element
-                    found_selector = selector
-                    logging.info(f"✅ Найдена видимая кнопка очистки поиска: {selector}")
-                    break
-            if clear_btn:
-                break
-        except Exception as e:
-            logging.debug(f"Ошибка при поиске по селектору '{selector}': {e}")
-            continue
+    clear_btn, found_selector = _first_visible(page, "clear_search", _CLEAR_SELECTORS)
+    if clear_btn:
+        logging.info(f"✅ Найдена видимая кнопка очистки поиска: {found_selector}")
     
     if clear_btn:
         try:
@@ -1501,9 +2160,9 @@ def _clear_search(page):
             # Метод 1: Обычный клик
             try:
                 clear_btn.scroll_into_view_if_needed()
-                page.wait_for_timeout(300)
+                pause(page, 300)
                 clear_btn.click(timeout=3000)
-                page.wait_for_timeout(1500)
+                wait_ready(page, "search_results")
                 logging.info("✅ Поиск очищен (обычный клик)")
                 success = True
             except Exception as e:
@@ -1513,7 +2172,7 @@ def _clear_search(page):
             if not success:
                 try:
                     page.evaluate("arguments[0].click()", clear_btn.element_handle())
-                    page.wait_for_timeout(1500)
+                    wait_ready(page, "search_results")
                     logging.info("✅ Поиск очищен (JS клик)")
                     success = True
                 except Exception as e:
@@ -1527,7 +2186,7 @@ def _clear_search(page):
                         x = bbox['x'] + bbox['width'] / 2
                         y = bbox['y'] + bbox['height'] / 2
                         page.mouse.click(x, y)
-                        page.wait_for_timeout(1500)
+                        wait_ready(page, "search_results")
                         logging.info("✅ Поиск очищен (клик по координатам)")
                         success = True
                 except Exception as e:
@@ -1547,23 +2206,16 @@ def _clear_search(page):
 
 def _clear_search_fallback(page):
     """Fallback метод для очистки поиска."""
-    search_selectors = [
-        "input[type='search']",
-        "input[placeholder*='Поиск']",
-        "input[placeholder*='поиск']",
-        "[data-testid*='search'] input",
-        ".search input",
-        "input[name*='search']",
-    ]
-    
-    for selector in search_selectors:
-        inp = page.locator(selector).first
-        if inp.count() > 0:
+    candidates = _SELECTORS.ordered("search_input", _SEARCH_INPUT_SELECTORS)
+    found = probe(page, candidates)
+    for selector in candidates:
+        if found.present(selector):
+            inp = page.locator(selector).first
             try:
                 inp.click()
-                page.wait_for_timeout(500)
+                pause(page, 500)
                 inp.fill("")
-                page.wait_for_timeout(1000)
+                wait_ready(page, "search_results")
                 logging.info("✅ Поиск очищен (fallback)")
                 return
             except Exception as e:
@@ -0,0 +1,14 @@
+"""Запуск Chromium для всех сценариев скриншотов."""
+
+
+def launch_chromium(p, headless: bool = False):
+    """Запускает Chromium из экземпляра sync_playwright *p*.
+
+    В headless-режиме используется полный Chromium (``channel="chromium"``)
+    в новом headless-режиме: он рендерит страницы тем же движком, что и
+    окно браузера, поэтому скриншоты совпадают с оконным режимом, а
+    виртуальный дисплей (Xvfb) не нужен.
+    """
+    if headless:
+        return p.chromium.launch(headless=True, channel="chromium")
+    return p.chromium.launch(headless=False)
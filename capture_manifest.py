@@ -0,0 +1,80 @@
+"""Манифест снятых скриншотов статистики групп.
+
+Фаза съёмки записывает сюда каждый готовый файл вкладки: ID и название
+группы, вкладку, путь, размеры, хэш содержимого и время съёмки. Отчёт и
+``main`` ищут скриншоты по манифесту, а не по соглашению об именах файлов и
+сканированию папки. Хранится JSON-файлом в папке с результатами.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from PIL import Image
+
+MANIFEST_VERSION = 1
+
+
+class CaptureManifest:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: dict[tuple[str, str], dict] = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self._entries = {(e["group_id"], e["tab"]): e for e in data["entries"]}
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+
+    def reset(self) -> None:
+        """Очищает манифест перед новым (не продолженным) прогоном."""
+        with self._lock:
+            self._entries.clear()
+
+    def record(self, group_id: str, group_name: str, tab: str, path: str | None) -> None:
+        """Записывает готовый файл вкладки; *path* None убирает запись."""
+        if not path or not os.path.exists(path):
+            with self._lock:
+                self._entries.pop((group_id, tab), None)
+            return
+        with open(path, "rb") as f:
+            sha256 = hashlib.sha256(f.read()).hexdigest()
+        # Открытие читает только заголовок PNG
+        with Image.open(path) as image:
+            width, height = image.size
+        entry = {
+            "group_id": group_id,
+            "group_name": group_name,
+            "tab": tab,
+            "path": path,
+            "width": width,
+            "height": height,
+            "sha256": sha256,
+            "captured_at": time.time(),
+        }
+        with self._lock:
+            self._entries[(group_id, tab)] = entry
+
+    def group_files(self, group_id: str) -> list[dict]:
+        """Записи группы: overview (воронка) первой, остальные по имени файла."""
+        with self._lock:
+            entries = [e for (gid, _), e in self._entries.items() if gid == group_id]
+        return sorted(entries, key=lambda e: (e["tab"] != "overview", os.path.basename(e["path"])))
+
+    def group_ids(self) -> set[str]:
+        """ID групп, у которых записан хотя бы один скриншот."""
+        with self._lock:
+            return {gid for gid, _ in self._entries}
+
+    def save(self) -> None:
+        with self._lock:
+            data = {"version": MANIFEST_VERSION, "entries": list(self._entries.values())}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+        logging.info(f"🗂️  Манифест скриншотов сохранён: {self.path} ({len(data['entries'])} файлов)")
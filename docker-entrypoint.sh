@@ -2,8 +2,9 @@
 set -e
 
 MODE="${1:-main}"
+shift || true
 
-if [ "$MODE" = "auth" ]; then
+start_display() {
     export DISPLAY=:99
     Xvfb :99 -screen 0 1920x1080x24 &
     sleep 1
@@ -15,21 +16,18 @@ if [ "$MODE" = "auth" ]; then
     echo " noVNC: http://localhost:6080/vnc.html"
     echo "========================================="
     echo ""
+}
+
+if [ "$MODE" = "auth" ]; then
+    start_display
     echo "Откройте ссылку выше в браузере."
     echo "Авторизуйтесь в VK, затем нажмите Enter здесь."
     echo ""
     python vk_ads_auth.py
+elif [ "$MODE" = "headless" ]; then
+    # Без Xvfb/VNC: браузеры запускаются в headless-режиме
+    python main.py --headless "$@"
 else
-    export DISPLAY=:99
-    Xvfb :99 -screen 0 1920x1080x24 &
-    sleep 1
-    x11vnc -display :99 -forever -passwd "${VNC_PASSWORD:-admin}" &
-    websockify --web /usr/share/novnc 6080 localhost:5900 &
-    sleep 1
-    echo ""
-    echo "========================================="
-    echo " noVNC: http://localhost:6080/vnc.html"
-    echo "========================================="
-    echo ""
-    python main.py
+    start_display
+    python main.py "$@"
 fi
@@ -0,0 +1,173 @@
+"""Проверка списка селекторов за один вызов ``evaluate``.
+
+Каскады селекторов раньше перебирались по одному: ``count()``, ``.all()``,
+``is_visible()`` и ``bounding_box()`` — каждый вызов это отдельный
+round-trip к браузеру. ``probe()`` отправляет весь список в страницу одним
+``evaluate`` и получает для каждого селектора число совпадений, индекс
+первого видимого элемента и рамки элементов.
+
+Селекторы, которые понимает только Playwright (``:has-text()``, ``text=``),
+``querySelectorAll`` не принимает — для них проверка делается обычными
+локаторами, и только если каскад до них дошёл. Запрашивается ровно то, что
+нужно: ``present()`` — один ``count()``, видимость и рамки — только по
+запросу ``visible()`` / ``info()``.
+"""
+import logging
+
+_PROBE_JS = """
+([root, selectors]) => {
+    root = root || document;
+    const rect = el => {
+        const r = el.getBoundingClientRect();
+        return {x: r.x, y: r.y, width: r.width, height: r.height};
+    };
+    const isVisible = el => {
+        const r = el.getBoundingClientRect();
+        return r.width > 0 && r.height > 0 && getComputedStyle(el).visibility !== 'hidden';
+    };
+    const matches = {};
+    for (const selector of selectors) {
+        let elements;
+        try {
+            elements = root.querySelectorAll(selector);
+        } catch (e) {
+            matches[selector] = {css: false};
+            continue;
+        }
+        const info = {css: true, count: elements.length, visible: -1, box: null, visible_box: null, last_box: null};
+        if (elements.length) {
+            info.box = rect(elements[0]);
+            info.last_box = rect(elements[elements.length - 1]);
+            for (let i = 0; i < elements.length; i++) {
+                if (isVisible(elements[i])) {
+                    info.visible = i;
+                    info.visible_box = rect(elements[i]);
+                    break;
+                }
+            }
+        }
+        matches[selector] = info;
+    }
+    return {matches, viewport: {width: window.innerWidth, height: window.innerHeight}};
+}
+"""
+
+
+def _box(locator) -> dict | None:
+    try:
+        return locator.bounding_box()
+    except Exception:
+        return None
+
+
+class DomProbe:
+    """Результат проверки списка селекторов в *scope* (page или locator)."""
+
+    def __init__(self, scope, selectors):
+        self.scope = scope
+        self.viewport: dict | None = None
+        self._matches: dict[str, dict] = {}
+        selectors = list(dict.fromkeys(selectors))
+        if not selectors:
+            return
+        try:
+            if hasattr(scope, "element_handle"):
+                # Локатор: поиск внутри найденного элемента
+                result = scope.evaluate("(el, sels) => (" + _PROBE_JS + ")([el, sels])", selectors)
+            else:
+                result = scope.evaluate(_PROBE_JS, [None, selectors])
+            self._matches = result["matches"]
+            self.viewport = result["viewport"]
+        except Exception as e:
+            # Страница в переходе или элемент пропал — проверяем локаторами
+            logging.debug(f"Пакетная проверка селекторов не удалась: {e}")
+
+    def _entry(self, selector: str) -> dict:
+        """Запись селектора; для не-CSS — заготовка, поля заполняются по запросу."""
+        entry = self._matches.get(selector)
+        if entry is None or (not entry["css"] and "count" not in entry):
+            entry = self._matches[selector] = {"css": False}
+            try:
+                entry["count"] = self.scope.locator(selector).count()
+            except Exception as e:
+                logging.debug(f"Ошибка при поиске по селектору '{selector}': {e}")
+                entry["count"] = 0
+        return entry
+
+    def count(self, selector: str) -> int:
+        return self._entry(selector)["count"]
+
+    def visible_index(self, selector: str) -> int:
+        """Индекс первого видимого элемента или -1."""
+        entry = self._entry(selector)
+        if "visible" not in entry:
+            entry["visible"] = -1
+            locator = self.scope.locator(selector)
+            for i in range(entry["count"]):
+                try:
+                    if locator.nth(i).is_visible():
+                        entry["visible"] = i
+                        break
+                except Exception:
+                    continue
+        return entry["visible"]
+
+    def info(self, selector: str) -> dict:
+        """Сведения о селекторе: count, visible (индекс или -1), box, visible_box, last_box."""
+        entry = self._entry(selector)
+        if "box" not in entry:
+            index = self.visible_index(selector)
+            locator = self.scope.locator(selector)
+            entry["visible_box"] = _box(locator.nth(index)) if index >= 0 else None
+            entry["box"] = None
+            entry["last_box"] = None
+            if entry["count"]:
+                entry["box"] = entry["visible_box"] if index == 0 else _box(locator.first)
+                entry["last_box"] = _box(locator.last)
+        return entry
+
+    def present(self, selector: str) -> bool:
+        return self.count(selector) > 0
+
+    def visible(self, selector: str) -> bool:
+        return self.visible_index(selector) >= 0
+
+    def first_present(self, candidates):
+        """Первый селектор из *candidates* с совпадениями: (locator, selector) или (None, None)."""
+        for selector in candidates:
+            if self.present(selector):
+                return self.scope.locator(selector).first, selector
+        return None, None
+
+    def first_visible(self, candidates):
+        """Первый селектор с видимым элементом: (locator этого элемента, selector) или (None, None)."""
+        for selector in candidates:
+            index = self.visible_index(selector)
+            if index >= 0:
+                return self.scope.locator(selector).nth(index), selector
+        return None, None
+
+
+_BOXES_JS = """
+els => ({
+    boxes: els.map(el => {
+        const r = el.getBoundingClientRect();
+        return {x: r.x, y: r.y, width: r.width, height: r.height};
+    }),
+    viewport: {width: window.innerWidth, height: window.innerHeight},
+})
+"""
+
+
+def element_boxes(locator) -> tuple[list[dict], dict]:
+    """Рамки всех элементов *locator* и размер окна одним запросом.
+
+    Несколько элементов объединяются через ``locator.or_(other)``.
+    """
+    result = locator.evaluate_all(_BOXES_JS)
+    return result["boxes"], result["viewport"]
+
+
+def probe(scope, selectors) -> DomProbe:
+    """Проверяет все *selectors* в *scope* одним запросом к странице."""
+    return DomProbe(scope, selectors)
@@ -0,0 +1,102 @@
+"""Фоновая обработка снимков в пуле процессов.
+
+Работа Pillow (панель браузера у постов, вырезка областей вкладок VK Ads,
+кодирование PNG) раньше шла в том же потоке, что управляет Playwright, и
+браузер простаивал, пока кодировались картинки. Теперь захват отдаёт сырые
+PNG-байты в ``ImagePipeline``, а обработка и запись файла идут в отдельных
+процессах на всех ядрах. ``close()`` дожидается всех задач — его вызывают
+до сборки отчёта.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from PIL import Image
+
+from screenshot_utils import draw_browser_bar
+
+
+def _compose_browser_bar(png: bytes, url: str, output_path: str) -> str:
+    draw_browser_bar(png, url, output_path)
+    return output_path
+
+
+def crop_png(png: bytes, box: tuple[int, int, int, int], output_path: str) -> str:
+    """Вырезает *box* (left, top, right, bottom в пикселях) из PNG и сохраняет."""
+    Image.open(BytesIO(png)).crop(box).save(output_path)
+    return output_path
+
+
+class ImagePipeline:
+    def __init__(self, workers: int | None = None):
+        self.workers = workers or os.cpu_count() or 1
+        # Процессы пула запускаются лениво, уже при работающих потоках Playwright;
+        # fork многопоточного процесса может унаследовать захваченные локи
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                         mp_context=multiprocessing.get_context(method))
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._failed = 0
+        self._idle = threading.Condition(self._lock)
+        logging.info(f"🧮 Обработка изображений в {self.workers} процессах")
+
+    def _submit(self, fn, *args, on_done=None) -> None:
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._pool.submit(fn, *args)
+        except Exception as e:
+            # Пул сломан (упал дочерний процесс) — обрабатываем на месте
+            logging.warning(f"⚠️  Пул обработки изображений недоступен, обрабатываем в потоке: {e}")
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as exc:
+                future.set_exception(exc)
+        future.add_done_callback(lambda f: self._finished(f, on_done, fn, args))
+
+    def _finished(self, future, on_done, fn, args) -> None:
+        try:
+            try:
+                path = future.result()
+            except BrokenProcessPool:
+                # Пул сломался, пока задача ждала очереди, — обрабатываем её на месте
+                logging.warning("⚠️  Пул обработки изображений сломан, обрабатываем задачу в потоке")
+                path = fn(*args)
+            if on_done is not None:
+                on_done()
+            logging.debug(f"🧮 Изображение сохранено: {path}")
+        except Exception as e:
+            with self._lock:
+                self._failed += 1
+            logging.error(f"❌ Ошибка обработки изображения: {e}")
+        finally:
+            with self._idle:
+                self._pending -= 1
+                self._idle.notify_all()
+
+    def browser_bar(self, png: bytes, url: str, output_path: str, on_done=None) -> None:
+        """Дорисовать панель браузера к снимку поста и сохранить в *output_path*.
+
+        *on_done* вызывается после записи файла (в потоке пула).
+        """
+        self._submit(_compose_browser_bar, png, url, output_path, on_done=on_done)
+
+    def crop(self, png: bytes, box: tuple[int, int, int, int], output_path: str, on_done=None) -> None:
+        """Вырезать область из снимка вкладки и сохранить в *output_path*."""
+        self._submit(crop_png, png, box, output_path, on_done=on_done)
+
+    def close(self) -> int:
+        """Дожидается всех задач и останавливает пул. Возвращает число ошибок."""
+        with self._idle:
+            if self._pending:
+                logging.info(f"⏳ Дожидаемся обработки изображений: {self._pending}")
+            self._idle.wait_for(lambda: self._pending == 0)
+        self._pool.shutdown()
+        logging.info(f"✅ Обработка изображений завершена, ошибок: {self._failed}")
+        return self._failed
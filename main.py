@@ -1,16 +1,115 @@
-from post_loader import load_posts
+from post_loader import index_by_group, iter_valid_posts
 from vk_screenshot import batch_screenshots
-from ads_screenshot import screenshot_multiple_groups_stats
-from report_generator import generate_report
+from ads_screenshot import CAPTURE_MODES, screenshot_multiple_groups_stats
+from capture_manifest import CaptureManifest
+from image_pipeline import ImagePipeline
+from report_generator import REPORT_IMAGE_FORMATS, REPORT_LAYOUTS, ReportBuilder
+from run_journal import RunJournal
+from screenshot_cache import ScreenshotCache
+from screenshot_utils import prefetch_favicon
+from wait_utils import WAIT_PROFILES, set_wait_profile
+import argparse
 import os
 import logging
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 
-def main() -> None:
-    """Полный цикл: загружаем XLSX, делаем скрины постов и VK Ads, формируем Word‑отчёт."""
-    
+def _parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="VK Ads Report Generator")
+    parser.add_argument(
+        "--input", default="posts.xlsx",
+        help="Список постов: .xlsx, .csv, .jsonl или - (stdin, CSV или JSON Lines)",
+    )
+    parser.add_argument(
+        "--post-workers", type=int, default=1,
+        help="Сколько постов снимать параллельно (отдельный браузер на воркер)",
+    )
+    parser.add_argument(
+        "--ads-workers", type=int, default=1,
+        help="Сколько групп VK Ads обрабатывать параллельно (рекомендуется 4–8)",
+    )
+    parser.add_argument(
+        "--deep-link", action="store_true",
+        help="Открывать статистику групп прямой ссылкой (поиск остаётся запасным вариантом)",
+    )
+    parser.add_argument(
+        "--stats-url-template", default=None,
+        help="Шаблон прямой ссылки на статистику с {group_id}; по умолчанию выучивается автоматически",
+    )
+    parser.add_argument(
+        "--wait-profile", choices=sorted(WAIT_PROFILES), default="normal",
+        help="Профиль таймаутов ожиданий в VK Ads: fast, normal или slow",
+    )
+    parser.add_argument(
+        "--headless", action="store_true",
+        help="Запускать браузеры без окна (не нужен дисплей/Xvfb)",
+    )
+    parser.add_argument(
+        "--cache-dir", default=".screenshot_cache",
+        help="Папка кэша скриншотов",
+    )
+    parser.add_argument(
+        "--cache-ttl", type=float, default=24,
+        help="Сколько часов скриншот в кэше считается свежим",
+    )
+    parser.add_argument(
+        "--cache-max-mb", type=int, default=2048,
+        help="Максимальный размер кэша скриншотов, МБ",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="Не использовать кэш скриншотов и кэш разбора входного файла",
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="Продолжить прерванный прогон: пропустить посты и вкладки групп из журнала",
+    )
+    parser.add_argument(
+        "--index-groups", action="store_true",
+        help="Один раз пройти таблицу групп VK Ads и построить индекс ID → название/ссылки",
+    )
+    parser.add_argument(
+        "--intercept-api", action="store_true",
+        help="Читать список групп и статистику из JSON-ответов дашборда VK Ads",
+    )
+    parser.add_argument(
+        "--capture-mode", choices=CAPTURE_MODES, default="element",
+        help="Съёмка вкладок VK Ads: element — по элементам, crop — один снимок вкладки и вырезка областей",
+    )
+    parser.add_argument(
+        "--image-workers", type=int, default=None,
+        help="Сколько процессов обрабатывают изображения в фоне (по умолчанию — число ядер, 0 — без пула)",
+    )
+    parser.add_argument(
+        "--sequential", action="store_true",
+        help="Снимать посты и статистику VK Ads по очереди, а не одновременно",
+    )
+    parser.add_argument(
+        "--report-format", choices=REPORT_IMAGE_FORMATS, default="jpeg",
+        help="Формат картинок в отчёте: jpeg, png (палитра) или original (исходные PNG)",
+    )
+    parser.add_argument(
+        "--report-quality", type=int, default=85,
+        help="Качество картинок в отчёте, 1–100 (JPEG-качество или доля цветов палитры)",
+    )
+    parser.add_argument(
+        "--report-dpi", type=int, default=150,
+        help="Плотность картинок в отчёте: ширина в пикселях = 5 дюймов × DPI",
+    )
+    parser.add_argument(
+        "--report-layout", choices=REPORT_LAYOUTS, default="per-post",
+        help="per-post — статистика под каждым постом; grouped — один раз на группу со ссылками из остальных постов",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    """Полный цикл: читаем список постов, делаем скрины постов и VK Ads, формируем Word‑отчёт."""
+    args = _parse_args(argv)
+
     # Настройка логирования
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     log_filename = f"vk_ads_log_{timestamp}.txt"
@@ -30,8 +129,8 @@ def main() -> None:
     
     logger.info("🚀 Запуск программы VK Ads Report Generator")
     logger.info(f"📝 Логи записываются в файл: {log_filename}")
+    set_wait_profile(args.wait_profile)
 
-    posts_file = "posts.xlsx"
     output_dir = "assets"
     output_doc = "Отчет.docx"
     ads_url = (
@@ -45,105 +144,150 @@ def main() -> None:
     os.makedirs(output_dir, exist_ok=True)
     logger.info(f"📁 Рабочая папка: {output_dir}")
 
-    logger.info("⏳ Читаю таблицу…")
-    posts = load_posts(posts_file)
-    logger.info(f"✅ Найдено {len(posts)} строк / ссылок")
+    cache = None
+    if not args.no_cache:
+        cache = ScreenshotCache(args.cache_dir, ttl_hours=args.cache_ttl,
+                                max_bytes=args.cache_max_mb * 1024 * 1024)
+        logger.info(f"💾 Кэш скриншотов: {args.cache_dir} (TTL {args.cache_ttl} ч)")
 
-    # Фильтруем строки - оставляем только с корректными названиями групп и ID
-    valid_posts = []
-    skipped_count = 0
-    
-    for idx, post in enumerate(posts, 1):
-        group_name = (post.get("Группа") or "").strip()
-        group_id = (post.get("ID_Группы") or "").strip()
-        
-        # Проверяем, что название группы содержит "ЦР26" или "ЦК26" и есть ID группы
-        upper_name = group_name.upper()
-        if not group_name or ("ЦР26" not in upper_name and "ЦК26" not in upper_name):
-            skipped_count += 1
-            logger.error(f"SKIPPED_NO_GROUP_NAME: [{idx}] Ссылка {post.get('Ссылка', 'N/A')} - название группы '{group_name}' не содержит ЦР26/ЦК26, пропускаю")
-            continue
-        
-        if not group_id:
-            skipped_count += 1
-            logger.error(f"SKIPPED_NO_GROUP_ID: [{idx}] Ссылка {post.get('Ссылка', 'N/A')} - отсутствует ID группы, пропускаю")
-            continue
-            
-        valid_posts.append(post)
-    
-    if skipped_count > 0:
-        logger.warning(f"⚠️  Пропущено {skipped_count} строк без ЦР26/ЦК26 в названии. Ищите по 'SKIPPED_NO_GROUP_NAME' для просмотра")
+    # Журнал прогона и манифест скриншотов: при --resume пропускаем уже сделанное
+    journal = RunJournal(os.path.join(output_dir, "journal.sqlite"))
+    manifest = CaptureManifest(os.path.join(output_dir, "capture_manifest.json"))
+    if args.resume:
+        logger.info(f"📒 Продолжаем прогон по журналу {journal.path}")
+    else:
+        journal.reset()
+        manifest.reset()
+
+    # Favicon для панели браузера — один раз, до съёмки
+    prefetch_favicon()
+
+    # Обработка изображений в фоновых процессах, пока браузеры снимают дальше
+    pipeline = ImagePipeline(args.image_workers) if args.image_workers != 0 else None
+
+    # Картинки отчёта уменьшаются по мере готовности файлов, а не после съёмки
+    inner_image = "inner.png"
+    report = ReportBuilder(args.report_format, args.report_quality, args.report_dpi)
+    if os.path.exists(inner_image):
+        report.prepare(inner_image)
+
+    # Прочитанные посты; список групп для фазы VK Ads строится по ним
+    read_posts = []
+    input_read = threading.Event()
+    input_over = threading.Event()
+
+    def streamed_posts():
+        # Загрузчик сразу отбрасывает строки без ЦР26/ЦК26 или без ID группы;
+        # посты уходят в съёмку по мере чтения
+        try:
+            for post in iter_valid_posts(args.input, use_cache=not args.no_cache):
+                read_posts.append(post)
+                yield post
+            input_read.set()
+        finally:
+            # Вход прочитан (или чтение упало) — фаза VK Ads может начинать
+            input_over.set()
+
+    def capture_posts():
+        logger.info(f"📸 Читаю {args.input} и делаю скрины постов по мере чтения…")
+        try:
+            posts = batch_screenshots(streamed_posts(), output_dir, workers=args.post_workers,
+                                      headless=args.headless, cache=cache, journal=journal, pipeline=pipeline,
+                                      on_post_done=lambda post: report.prepare(post["Скриншот"]))
+        finally:
+            # Фаза VK Ads не должна ждать вечно, если съёмка упала до конца входа
+            input_over.set()
+        logger.info("✅ Скрины постов готовы")
+        return posts
 
-    logger.info(f"✅ К обработке: {len(valid_posts)} строк с ЦР26/ЦК26 в названии групп")
+    def capture_groups():
+        # Список групп известен, когда вход прочитан целиком; сами посты
+        # к этому моменту могут ещё сниматься
+        input_over.wait()
+        if not input_read.is_set() or not read_posts:
+            return [], []
+        # Уникальные группы (ID + название) — по индексу постов
+        posts_by_group = index_by_group(read_posts)
+        unique_groups = [
+            {"id": group_id, "name": posts[0].group_key, "display_name": posts[0].group}
+            for group_id, posts in posts_by_group.items()
+        ]
+        logger.info(f"📊 Обрабатываем {len(unique_groups)} уникальных групп ({args.ads_workers} стр. VK Ads)...")
+        # Используем оптимизированную функцию для всех групп сразу
+        return screenshot_multiple_groups_stats(
+            groups=unique_groups,
+            output_dir=output_dir,
+            ads_url=ads_url,
+            demography_zoom=1.0,  # Без масштабирования для демографии
+            geo_zoom=1.0,         # Без масштабирования для географии
+            viewport_width=1920,
+            viewport_height=1200,
+            workers=args.ads_workers,
+            deep_link=args.deep_link,
+            stats_url_template=args.stats_url_template,
+            headless=args.headless,
+            cache=cache,
+            journal=journal,
+            preflight_index=args.index_groups,
+            intercept_api=args.intercept_api,
+            capture_mode=args.capture_mode,
+            pipeline=pipeline,
+            manifest=manifest,
+            on_tab_saved=lambda group, tab, path: report.prepare(path),
+        )
+
+    if args.sequential:
+        valid_posts = capture_posts()
+        successful_groups, failed_groups = capture_groups()
+    else:
+        # Посты (vk.com) и статистика (ads.vk.com) не зависят друг от друга и
+        # снимаются одновременно в своих браузерах; общее время — самая долгая фаза
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="phase") as phases:
+            posts_phase = phases.submit(capture_posts)
+            groups_phase = phases.submit(capture_groups)
+            successful_groups, failed_groups = groups_phase.result()
+            valid_posts = posts_phase.result()
 
     if not valid_posts:
         logger.error("❌ Не найдено ни одной строки с ЦР26/ЦК26 в названии группы!")
+        if pipeline is not None:
+            pipeline.close()
+        report.close()
+        journal.close()
         return
-
-    logger.info("📸 Делаю скрины постов…")
-    batch_screenshots(valid_posts, output_dir)
-    logger.info("✅ Скрины постов готовы")
-
-    # Собираем уникальные группы (ID + название) для оптимизированной обработки
-    unique_groups = []
-    seen_groups = set()
-    
-    for post in valid_posts:
-        group_id = post.get("ID_Группы", "").strip()
-        group_name = post.get("Группа", "").upper()
-        
-        # Используем ID как ключ уникальности, но передаем и ID и название
-        if group_id and group_id not in seen_groups:
-            unique_groups.append({
-                "id": group_id,
-                "name": group_name,
-                "display_name": post.get("Группа", "")
-            })
-            seen_groups.add(group_id)
-
-    logger.info(f"📊 Обрабатываем {len(unique_groups)} уникальных групп в одном браузере...")
-    
-    # Используем оптимизированную функцию для всех групп сразу
-    successful_groups, failed_groups = screenshot_multiple_groups_stats(
-        groups=unique_groups,
-        output_dir=output_dir,
-        ads_url=ads_url,
-        demography_zoom=1.0,  # Без масштабирования для демографии
-        geo_zoom=1.0,         # Без масштабирования для географии
-        viewport_width=1920,
-        viewport_height=1200
-    )
+    posts_by_group = index_by_group(valid_posts)
     
     logger.info(f"✅ VK Ads статистика готова. Успешно: {len(successful_groups)}, Ошибки: {len(failed_groups)}")
 
-    # Фильтруем посты - оставляем только те, для которых успешно создали скрины статистики
-    posts_for_report = []
+    # Все файлы должны быть записаны до сборки отчёта
+    if pipeline is not None:
+        pipeline.close()
+    # Фоновая обработка могла добавить записи в кэш после сохранения фаз
+    if cache is not None:
+        cache.save()
+    manifest.save()
+
+    # Посты групп с ошибками статистики не попадают в отчёт
     skipped_campaigns = 0
-    
-    for post in valid_posts:
-        group_name = post.get("Группа", "")
-        # Проверяем, есть ли группа среди успешно обработанных (по display_name)
-        group_found = any(
-            group.get("display_name", "") == group_name 
-            for group in successful_groups
-        )
-        
-        if group_found:
-            posts_for_report.append(post)
-        else:
+    for group in failed_groups:
+        for post in posts_by_group.get(group["id"], []):
             skipped_campaigns += 1
-            logger.warning(f"🚫 Пропускаю кампанию '{group_name}' из отчета - не удалось получить статистику")
+            logger.warning(f"🚫 Пропускаю кампанию '{post.group}' из отчета - не удалось получить статистику")
+    failed_ids = {group["id"] for group in failed_groups}
+    posts_for_report = [post for post in valid_posts if post.group_id not in failed_ids]
     
     if skipped_campaigns > 0:
         logger.warning(f"⚠️  Пропущено {skipped_campaigns} кампаний из отчета из-за ошибок статистики")
+    # Группа без записей в манифесте попадёт в отчёт без скриншотов статистики
+    captured_ids = manifest.group_ids()
+    for group_id in {post.group_id for post in posts_for_report} - captured_ids:
+        logger.warning(f"🖼️  Нет скриншотов статистики в манифесте для группы ID {group_id}")
     
     logger.info(f"📝 Собираю DOCX для {len(posts_for_report)} успешных кампаний…")
-    try:
-        generate_report(posts_for_report, output_doc, assets_dir=output_dir, inner_image="inner.png")
-    except TypeError:
-        # Fallback для старой версии функции
-        generate_report(posts_for_report, output_doc)
+    report.build(posts_for_report, output_doc, assets_dir=output_dir, inner_image=inner_image,
+                 manifest=manifest, layout=args.report_layout)
 
+    journal.close()
     logger.info("✅ Отчёт готов!")
     logger.info("🏁 Программа завершена успешно")
 
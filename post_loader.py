@@ -1,64 +1,350 @@
-import pandas as pd
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import pickle
+import re
+import sys
+from dataclasses import dataclass, replace
 
-def load_posts(file_path: str) -> list[dict]:
+from openpyxl import load_workbook
+
+# Шаблоны разбора ячеек, компилируются один раз
+_LINK_RE = re.compile(r"vk\.com/wall")
+_GROUP_RE = re.compile(r"ЦР26|ЦК26")
+_GROUP_ID_RE = re.compile(r"\d+")
+
+# Названия групп, которые попадают в отчёт
+GROUP_MARKERS = ("ЦР26", "ЦК26")
+
+# Версия формата кэша разобранного входа; меняется вместе с PostRecord и правилами разбора
+_CACHE_VERSION = 2
+
+# Русские ключи словаря поста → поля PostRecord
+_FIELDS = {
+    "Компания": "company",
+    "Ссылка": "link",
+    "Группа": "group",
+    "ID_Группы": "group_id",
+    "Скриншот": "screenshot",
+}
+
+
+@dataclass(slots=True)
+class PostRecord:
+    """Пост из таблицы с нормализованной группой.
+
+    Поддерживает доступ как у словаря по русским ключам
+    (``post["Группа"]``, ``post.get("Скриншот")``), поэтому остальной код
+    работает с записью так же, как раньше со словарём.
+    """
+    company: str
+    link: str
+    group: str
+    group_id: str
+    # Название группы в верхнем регистре — так оно используется в VK Ads
+    group_key: str = ""
+    screenshot: str = ""
+
+    def __post_init__(self):
+        self.group = self.group.strip()
+        self.group_id = self.group_id.strip()
+        self.group_key = self.group.upper()
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, _FIELDS[key])
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value) -> None:
+        setattr(self, _FIELDS[key], value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in _FIELDS
+
+    def get(self, key: str, default=None):
+        return getattr(self, _FIELDS[key]) if key in _FIELDS else default
+
+
+def _cell_text(value) -> str:
+    return str(value).strip() if value is not None else ""
+
+
+def _parse_cell(company: str, cell: str, following=()) -> PostRecord | None:
+    """Разбирает ячейку со ссылкой VK: ссылка, название группы и ID по строкам.
+
+    *following* — соседние ячейки справа, в них ищется ID группы, если его
+    нет в самой ячейке. None — в ячейке нет ссылки.
+    """
+    # Разделяем по переносам строк и пробелам
+    lines = cell.strip().split('\n')
+
+    link = ""
+    group = "Без_имени"
+    group_id = ""
+
+    # Парсим строки
+    for line in lines:
+        line = line.strip()
+        if _LINK_RE.search(line):
+            link = line
+        elif _GROUP_RE.match(line):
+            group = line
+        elif _GROUP_ID_RE.fullmatch(line):
+            group_id = line
+
+    # Если не нашли все данные в одной ячейке, проверяем соседние ячейки
+    if not group_id:
+        # Проверяем следующие ячейки на наличие ID (только цифры)
+        for value in following:
+            next_cell = _cell_text(value)
+            if _GROUP_ID_RE.fullmatch(next_cell):
+                group_id = next_cell
+                break
+
+    if not link:  # Добавляем только если есть ссылка
+        return None
+    return PostRecord(company, link, group, group_id)
+
+
+def _posts_from_row(row):
+    """Посты одной строки таблицы: компания в первой ячейке, ссылки — в остальных."""
+    if not row:
+        return
+    company = _cell_text(row[0])
+    # Ищем ячейку со ссылкой VK
+    for i, cell in enumerate(row[1:], 1):
+        if isinstance(cell, str) and _LINK_RE.search(cell):
+            post = _parse_cell(company, cell, row[i + 1:i + 3])
+            if post is not None:
+                yield post
+
+
+def _iter_xlsx(file_path: str):
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield from _posts_from_row(row)
+    finally:
+        workbook.close()
+
+
+def _iter_csv(stream):
+    # Ячейки CSV могут быть многострочными, как в Excel
+    for row in csv.reader(stream):
+        yield from _posts_from_row(row)
+
+
+def _iter_jsonl(stream):
+    """JSON Lines: строка — массив ячеек (как строка таблицы) или объект.
+
+    В объекте ссылка лежит в ``Ссылка``/``link`` и разбирается как ячейка
+    таблицы; ``Группа``/``group`` и ``ID_Группы``/``group_id``, если заданы,
+    дополняют то, чего в ячейке не нашлось.
+    """
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            logging.error(f"❌ Строка {line_no} JSON Lines не разобрана: {e}")
+            continue
+        if isinstance(item, list):
+            yield from _posts_from_row(item)
+            continue
+        if not isinstance(item, dict):
+            continue
+        cell = "\n".join(_cell_text(item.get(key)) for key in ("Ссылка", "link", "Группа", "group")
+                         if item.get(key) is not None)
+        group_id = item.get("ID_Группы", item.get("group_id"))
+        post = _parse_cell(_cell_text(item.get("Компания", item.get("company"))), cell, [group_id])
+        if post is not None:
+            yield post
+
+
+def _iter_stdin():
+    # Формат определяется по первой непустой строке: "{" или "[" — JSON Lines
+    stream = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig")
+    first = ""
+    for first in stream:
+        if first.strip():
+            break
+    rest = _chain_line(first, stream)
+    if first.lstrip().startswith(("{", "[")):
+        yield from _iter_jsonl(rest)
+    else:
+        yield from _iter_csv(rest)
+
+
+def _chain_line(first: str, stream):
+    if first:
+        yield first
+    yield from stream
+
+
+def iter_posts(source: str):
+    """Отдаёт посты по мере разбора входного файла, без проверки групп.
+
+    *source* — путь к .xlsx, .csv, .jsonl/.ndjson или ``-`` (stdin, CSV или
+    JSON Lines). Excel открывается в режиме ``read_only``, текстовые форматы
+    читаются построчно, поэтому память не растёт даже на сотнях тысяч строк.
+    Правила извлечения ссылки, группы и ID одинаковы для всех форматов.
+    """
+    if source == "-":
+        yield from _iter_stdin()
+        return
+    ext = os.path.splitext(source)[1].lower()
+    if ext in (".csv", ".jsonl", ".ndjson"):
+        with open(source, "r", encoding="utf-8-sig", newline="") as f:
+            yield from (_iter_csv(f) if ext == ".csv" else _iter_jsonl(f))
+    else:
+        yield from _iter_xlsx(source)
+
+
+def _skip_reason(post: PostRecord) -> str | None:
+    """Почему пост не попадает в обработку; None — пост корректен."""
+    # Название группы должно содержать "ЦР26" или "ЦК26", и нужен ID группы
+    if not post.group or not any(marker in post.group_key for marker in GROUP_MARKERS):
+        return "SKIPPED_NO_GROUP_NAME"
+    if not post.group_id:
+        return "SKIPPED_NO_GROUP_ID"
+    return None
+
+
+def _cache_path(source: str) -> str:
+    # Кэш лежит рядом со входом: posts.xlsx → .posts.xlsx.cache.pkl
+    folder, name = os.path.split(source)
+    return os.path.join(folder, f".{name}.cache.pkl")
+
+
+def _source_key(source: str) -> tuple:
+    """Ключ кэша: версия формата, размер, mtime и SHA-256 содержимого файла."""
+    stat = os.stat(source)
+    digest = hashlib.sha256()
+    with open(source, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return _CACHE_VERSION, stat.st_size, stat.st_mtime_ns, digest.hexdigest()
+
+
+def _read_cache(path: str, key: tuple):
+    try:
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        if data["key"] == key:
+            return data
+    except Exception:
+        # Повреждённый или чужой файл (другая версия Python, протокол) — разбираем заново
+        pass
+    return None
+
+
+def _write_cache(path: str, key: tuple, posts: list, found: int, skips: list) -> None:
+    data = {"key": key, "posts": posts, "found": found, "skips": skips}
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.warning(f"⚠️  Не удалось сохранить кэш входа {path}: {e}")
+
+
+def _log_skip(reason: str, idx: int, link: str, group: str) -> None:
+    if reason == "SKIPPED_NO_GROUP_NAME":
+        logging.error(f"{reason}: [{idx}] Ссылка {link} - название группы '{group}' не содержит ЦР26/ЦК26, пропускаю")
+    elif reason == "SKIPPED_NO_GROUP_ID":
+        logging.error(f"{reason}: [{idx}] Ссылка {link} - отсутствует ID группы, пропускаю")
+
+
+def _log_summary(found: int, skipped: int, valid: int) -> None:
+    logging.info(f"✅ Найдено {found} строк / ссылок")
+    if skipped > 0:
+        logging.warning(f"⚠️  Пропущено {skipped} строк без ЦР26/ЦК26 в названии. Ищите по 'SKIPPED_NO_GROUP_NAME' для просмотра")
+    logging.info(f"✅ К обработке: {valid} строк с ЦР26/ЦК26 в названии групп")
+
+
+def iter_valid_posts(source: str, use_cache: bool = True):
+    """Как iter_posts, но только корректные посты (группа ЦР26/ЦК26 и есть ID).
+
+    Пропущенные строки пишутся в лог с метками SKIPPED_NO_GROUP_NAME /
+    SKIPPED_NO_GROUP_ID, итоги — после разбора всего входа.
+
+    Разобранные посты файла сохраняются в кэш рядом с ним (см. _cache_path).
+    Пока размер, mtime и хэш файла не изменились, посты берутся из кэша без
+    разбора. stdin не кэшируется; *use_cache* False отключает кэш.
+    """
+    cache_path = key = None
+    if use_cache and source != "-":
+        cache_path = _cache_path(source)
+        key = _source_key(source)
+        cached = _read_cache(cache_path, key)
+        if cached is not None:
+            logging.info(f"💾 Посты взяты из кэша разбора: {cache_path}")
+            # Пропущенные строки повторяем в логе этого прогона
+            for skip in cached["skips"]:
+                _log_skip(*skip)
+            posts = cached["posts"]
+            yield from posts
+            _log_summary(cached["found"], len(cached["skips"]), len(posts))
+            return
+
+    found = 0
+    skips = []
+    valid_posts = []
+
+    for idx, post in enumerate(iter_posts(source), 1):
+        found += 1
+        reason = _skip_reason(post)
+        if reason:
+            skip = (reason, idx, post.link, post.group)
+            _log_skip(*skip)
+            skips.append(skip)
+            continue
+        if cache_path is not None:
+            # Копия до выдачи: потребитель дописывает в пост путь скриншота
+            valid_posts.append(replace(post))
+        yield post
+
+    if not found:
+        raise ValueError(
+            "В таблице не найдено ни одной ячейки формата "
+            "'https://vk.com/wall… <название группы>'"
+        )
+
+    if cache_path is not None:
+        _write_cache(cache_path, key, valid_posts, found, skips)
+    _log_summary(found, len(skips), found - len(skips))
+
+
+def load_posts(file_path: str) -> list[PostRecord]:
     """Читает Excel-таблицу вида:
        ┌──────────────┬────────────────────────────┬────────────────┬──────────┐
        │ Про_Измайлово│ https://…  ЦР25_…          │ ЦР25_…        │ 118746396│
        └──────────────┴────────────────────────────┴────────────────┴──────────┘
 
-    Возвращает список словарей:
+    Возвращает только корректные посты (группа ЦР26/ЦК26 и есть ID группы)
+    как PostRecord — по русским ключам они читаются как словари:
     {
         "Компания": "Про_Измайлово",
         "Ссылка":   "https://vk.com/wall-…",
-        "Группа":   "ЦР25_ИЗМАЙЛОВО_БЛАГОУСТРОЙСТВО",
+        "Группа":   "ЦР26_ИЗМАЙЛОВО_БЛАГОУСТРОЙСТВО",
         "ID_Группы": "118746396"
     }
+    Кроме .xlsx принимаются .csv, .jsonl и ``-`` (stdin), см. iter_posts.
+    Повторные вызовы для неизменённого файла читают кэш разбора.
     """
-    df = pd.read_excel(file_path, header=None)
-    posts: list[dict] = []
-
-    for _, row in df.iterrows():
-        company = str(row[0]).strip()
-        # Ищем ячейку со ссылкой VK
-        for i, cell in enumerate(row[1:], 1):
-            if isinstance(cell, str) and "vk.com/wall" in cell:
-                # Разделяем по переносам строк и пробелам
-                lines = cell.strip().split('\n')
-                
-                link = ""
-                group = "Без_имени" 
-                group_id = ""
-                
-                # Парсим строки
-                for line in lines:
-                    line = line.strip()
-                    if "vk.com/wall" in line:
-                        link = line
-                    elif line.startswith("ЦР26") or line.startswith("ЦК26"):
-                        group = line
-                    elif line.isdigit():
-                        group_id = line
-                
-                # Если не нашли все данные в одной ячейке, проверяем соседние ячейки
-                if not group_id:
-                    # Проверяем следующие ячейки на наличие ID (только цифры)
-                    for j in range(i + 1, min(i + 3, len(row))):
-                        next_cell = str(row[j]).strip() if pd.notna(row[j]) else ""
-                        if next_cell.isdigit():
-                            group_id = next_cell
-                            break
-                
-                if link:  # Добавляем только если есть ссылка
-                    posts.append({
-                        "Компания": company, 
-                        "Ссылка": link, 
-                        "Группа": group,
-                        "ID_Группы": group_id
-                    })
-
-    if not posts:
-        raise ValueError(
-            "В таблице не найдено ни одной ячейки формата "
-            "'https://vk.com/wall… <название группы>'"
-        )
-    return posts
+    return list(iter_valid_posts(file_path))
+
+
+def index_by_group(posts) -> dict[str, list[PostRecord]]:
+    """ID группы → её посты; группы идут в порядке первого появления."""
+    index: dict[str, list[PostRecord]] = {}
+    for post in posts:
+        index.setdefault(post.group_id, []).append(post)
+    return index
@@ -1,21 +1,218 @@
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from docx import Document
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.oxml.shape import CT_Inline
 from docx.shared import Inches
+from PIL import Image
 import os
 import logging
+import threading
+
+# Ширина картинок в отчёте
+PICTURE_WIDTH_INCHES = 5
+# Форматы картинок для отчёта: jpeg, png (палитра) или original (без изменений).
+# WebP Word не показывает, поэтому его нет.
+REPORT_IMAGE_FORMATS = ("jpeg", "png", "original")
+# Папка рядом с исходниками, где лежат уменьшенные копии
+REPORT_IMAGE_DIR = "_report"
+# Раскладка отчёта: статистика под каждым постом или один раз на группу
+REPORT_LAYOUTS = ("per-post", "grouped")
+# Окончания имён файлов статистики ({ГРУППА}{окончание}.png), длинные раньше
+STATS_FILE_SUFFIXES = ("_overview_funnel", "_overview_graph", "_overview", "_demography", "_geo")
+
+
+def optimize_image(path: str, fmt: str = "jpeg", quality: int = 85, dpi: int = 150) -> str:
+    """Копия картинки под размер в отчёте; возвращает путь к ней.
+
+    Картинка уменьшается до ширины PICTURE_WIDTH_INCHES × *dpi* пикселей и
+    сохраняется в JPEG с качеством *quality* или в PNG с палитрой (число
+    цветов — *quality* % от 256). Копия кэшируется в подпапке
+    REPORT_IMAGE_DIR рядом с исходником и пересоздаётся, только если
+    исходник новее. При ошибке возвращается исходный путь.
+
+    Args:
+        path: Исходная картинка
+        fmt: jpeg, png или original
+        quality: Качество JPEG / доля цветов палитры, 1–100
+        dpi: Плотность печати для ширины в отчёте
+    """
+    if fmt == "original":
+        return path
+    folder, name = os.path.split(path)
+    ext = "jpg" if fmt == "jpeg" else "png"
+    out_dir = os.path.join(folder, REPORT_IMAGE_DIR)
+    out_path = os.path.join(out_dir, f"{os.path.splitext(name)[0]}.{dpi}dpi-q{quality}.{ext}")
+    try:
+        if os.path.exists(out_path) and os.path.getmtime(out_path) >= os.path.getmtime(path):
+            return out_path
+        os.makedirs(out_dir, exist_ok=True)
+
+        image = Image.open(path)
+        target_width = int(PICTURE_WIDTH_INCHES * dpi)
+        if image.width > target_width:
+            target_height = max(1, round(image.height * target_width / image.width))
+            image = image.resize((target_width, target_height), Image.LANCZOS)
+
+        if image.mode in ("RGBA", "LA", "P"):
+            # Прозрачность — на белый фон
+            image = image.convert("RGBA")
+            background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+            image = Image.alpha_composite(background, image)
+        image = image.convert("RGB")
+
+        if fmt == "jpeg":
+            image.save(out_path, "JPEG", quality=quality, optimize=True, dpi=(dpi, dpi))
+        else:
+            colors = max(2, min(256, round(256 * quality / 100)))
+            image.quantize(colors=colors).save(out_path, "PNG", optimize=True, dpi=(dpi, dpi))
+        return out_path
+    except Exception as e:
+        logging.warning(f"⚠️  Не удалось оптимизировать {path}, вставляю исходник: {e}")
+        return path
+
+
+def build_asset_index(assets_dir: str, group_names) -> dict[str, list[str]]:
+    """Индекс скриншотов статистики: группа (в верхнем регистре) → пути к файлам.
+
+    Папка читается один раз. У файла ``{ГРУППА}{окончание}.png`` отрезается
+    известное окончание вкладки (STATS_FILE_SUFFIXES), и остаток должен в
+    точности совпасть с названием группы отчёта — файлы других групп, даже
+    с общим началом названия, не подхватываются. Воронка
+    (``_overview_funnel``) идёт первой, остальные — по имени.
+    """
+    names = {name.upper() for name in group_names if name}
+    index: dict[str, list[str]] = defaultdict(list)
+    try:
+        files = sorted(os.listdir(assets_dir))
+    except OSError as e:
+        logging.warning(f"⚠️  Папка скриншотов {assets_dir} недоступна: {e}")
+        return {}
+
+    for fname in files:
+        if not fname.lower().endswith(".png"):
+            continue
+        stem = fname[:-4].upper()
+        for suffix in STATS_FILE_SUFFIXES:
+            if stem.endswith(suffix.upper()):
+                group = stem[:-len(suffix)]
+                if group in names:
+                    index[group].append(os.path.join(assets_dir, fname))
+                break
+
+    for paths in index.values():
+        paths.sort(key=lambda path: not path.upper().endswith("_OVERVIEW_FUNNEL.PNG"))
+    return dict(index)
+
+
+class _PictureCache:
+    """Вставка картинок, при которой каждый файл читается и измеряется один раз.
+
+    ``doc.add_picture`` на каждый вызов заново читает файл и считает его
+    хэш, чтобы найти уже добавленную часть документа. Здесь часть и размеры
+    картинки запоминаются по пути, а повторная вставка только создаёт
+    новый inline-элемент со ссылкой на ту же часть.
+    """
+
+    def __init__(self, doc):
+        self.doc = doc
+        self._images: dict[str, tuple] = {}
+
+    def add(self, path: str, width) -> None:
+        part = self.doc.part
+        cached = self._images.get(path)
+        if cached is None:
+            cached = self._images[path] = part.get_or_add_image(path)
+        rId, image = cached
+        cx, cy = image.scaled_dimensions(width, None)
+        inline = CT_Inline.new_pic_inline(part.next_id, rId, image.filename, cx, cy)
+        self.doc.add_paragraph().add_run()._r.add_drawing(inline)
+
+
+def _add_bookmark(paragraph, name: str, bookmark_id: int) -> None:
+    start = OxmlElement("w:bookmarkStart")
+    start.set(qn("w:id"), str(bookmark_id))
+    start.set(qn("w:name"), name)
+    end = OxmlElement("w:bookmarkEnd")
+    end.set(qn("w:id"), str(bookmark_id))
+    # pPr должен оставаться первым дочерним элементом абзаца
+    paragraph._p.insert(1 if paragraph._p.pPr is not None else 0, start)
+    paragraph._p.append(end)
+
+
+def _add_internal_link(paragraph, text: str, anchor: str) -> None:
+    link = OxmlElement("w:hyperlink")
+    link.set(qn("w:anchor"), anchor)
+    run = OxmlElement("w:r")
+    rpr = OxmlElement("w:rPr")
+    color = OxmlElement("w:color")
+    color.set(qn("w:val"), "0563C1")
+    underline = OxmlElement("w:u")
+    underline.set(qn("w:val"), "single")
+    rpr.append(color)
+    rpr.append(underline)
+    run.append(rpr)
+    t = OxmlElement("w:t")
+    t.set(qn("xml:space"), "preserve")
+    t.text = text
+    run.append(t)
+    link.append(run)
+    paragraph._p.append(link)
+
 
 def generate_report(posts: list[dict],
                     output_file: str = "Отчёт.docx",
                     assets_dir: str = "assets",
-                    inner_image: str = "inner.png") -> None:
+                    inner_image: str = "inner.png",
+                    image_format: str = "jpeg",
+                    image_quality: int = 85,
+                    image_dpi: int = 150,
+                    manifest=None,
+                    layout: str = "per-post",
+                    prepared: dict[str, str] | None = None) -> None:
+    """Собирает Word-отчёт по постам и скриншотам статистики.
+
+    Картинки перед вставкой уменьшаются под ширину в отчёте (см.
+    optimize_image); *image_format* = "original" вставляет исходные PNG.
+    Скриншоты групп берутся из *manifest* (CaptureManifest) по ID группы;
+    без манифеста — из индекса папки *assets_dir* по названию группы.
+    При *layout* = "grouped" статистика группы (и inner.png) выводится один
+    раз — под первым постом группы, с закладкой; остальные посты группы
+    ссылаются на неё внутренней гиперссылкой.
+    *prepared* — уже уменьшенные копии (исходный путь → копия), например из
+    ReportBuilder; остальные картинки уменьшаются здесь.
+    """
+    optimized: dict[str, str] = dict(prepared or {})
+
+    def add_picture(path: str) -> None:
+        if path not in optimized:
+            optimized[path] = optimize_image(path, image_format, image_quality, image_dpi)
+        pictures.add(optimized[path], Inches(PICTURE_WIDTH_INCHES))
+
     doc = Document()
+    pictures = _PictureCache(doc)
     doc.add_heading("Отчёт по рекламным кампаниям VK", level=0)
 
+    # Скриншоты статистики по группам: из манифеста или одним проходом по папке
+    if manifest is not None:
+        def group_stats(post) -> list[str]:
+            return [e["path"] for e in manifest.group_files((post.get("ID_Группы") or "").strip())]
+    else:
+        asset_index = build_asset_index(assets_dir, (p["Группа"] for p in posts))
+
+        def group_stats(post) -> list[str]:
+            return asset_index.get(post["Группа"].upper(), [])
+    has_inner = os.path.exists(inner_image)
+
     # группируем посты по компании
     grouped = defaultdict(list)
     for p in posts:
         grouped[p["Компания"]].append(p)
 
+    # Закладки уже выведенной статистики групп (раскладка grouped)
+    stats_anchors: dict[str, str] = {}
+
     for company, items in grouped.items():
         doc.add_heading(company, level=1)
 
@@ -26,34 +223,31 @@ def generate_report(posts: list[dict],
 
             # скрин поста
             if os.path.exists(post.get("Скриншот", "")):
-                doc.add_picture(post["Скриншот"], width=Inches(5))
-
-            # Проверяем, есть ли файлы статистики для этой группы
-            prefix = post["Группа"].upper()
-            has_stats = False
-            
-            # сначала добавляем overview_funnel сразу после поста
-            funnel_file = f"{post['Группа'].upper()}_overview_funnel.png"
-            funnel_path = os.path.join(assets_dir, funnel_file)
-            if os.path.exists(funnel_path):
-                doc.add_picture(funnel_path, width=Inches(5))
-                has_stats = True
-                logging.info(f"✅ Добавлен overview_funnel для группы: {post['Группа']}")
+                add_picture(post["Скриншот"])
 
-            # затем все остальные скрины статистики (кроме funnel)
-            stats = sorted(
-                f for f in os.listdir(assets_dir)
-                if f.upper().startswith(prefix) and f.lower().endswith(".png")
-                and not f.endswith("_overview_funnel.png")  # исключаем funnel
-            )
-            for fname in stats:
-                doc.add_picture(os.path.join(assets_dir, fname), width=Inches(5))
-                has_stats = True
+            group_key = (post.get("ID_Группы") or "").strip() or post["Группа"].upper()
+            if layout == "grouped" and group_key in stats_anchors:
+                _add_internal_link(doc.add_paragraph(), f"📊 Статистика группы {post['Группа']} — см. выше",
+                                   stats_anchors[group_key])
+                continue
+
+            # Файлы статистики группы: overview_funnel первым, сразу после поста
+            stats = group_stats(post)
+            if layout == "grouped" and stats:
+                anchor = f"group_stats_{len(stats_anchors) + 1}"
+                _add_bookmark(doc.add_heading(f"Статистика группы {post['Группа']}", level=3),
+                              anchor, len(stats_anchors) + 1)
+                stats_anchors[group_key] = anchor
+            for path in stats:
+                add_picture(path)
+            if stats and stats[0].upper().endswith("_OVERVIEW_FUNNEL.PNG"):
+                logging.info(f"✅ Добавлен overview_funnel для группы: {post['Группа']}")
+            has_stats = bool(stats)
 
             # добавляем inner.png ТОЛЬКО если есть файлы статистики
             if has_stats:
-                if os.path.exists(inner_image):
-                    doc.add_picture(inner_image, width=Inches(5))
+                if has_inner:
+                    add_picture(inner_image)
                     logging.info(f"✅ Добавлен {inner_image} для группы: {post['Группа']}")
                 else:
                     logging.warning(f"⚠️  Файл {inner_image} не найден")
@@ -62,3 +256,75 @@ def generate_report(posts: list[dict],
 
     doc.save(output_file)
     logging.info(f"📄 Отчёт сохранён: {output_file}")
+
+
+class ReportBuilder:
+    """Отчёт, картинки которого готовятся по мере съёмки.
+
+    Фазы съёмки передают в ``prepare`` каждый записанный файл, и его
+    уменьшенная копия (optimize_image) делается в фоновых потоках, пока
+    браузеры снимают дальше. ``build`` дожидается копий и собирает документ
+    через generate_report в порядке постов, поэтому результат не зависит от
+    того, в каком порядке файлы были готовы.
+    """
+
+    def __init__(self, image_format: str = "jpeg", image_quality: int = 85, image_dpi: int = 150,
+                 workers: int = 2):
+        self.image_format = image_format
+        self.image_quality = image_quality
+        self.image_dpi = image_dpi
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="report")
+        self._lock = threading.Lock()
+        self._futures = {}
+
+    def prepare(self, path: str) -> None:
+        """Начать готовить копию *path* для отчёта; безопасно из любого потока.
+
+        Если файл по тому же пути перезаписан (повторная съёмка), копия
+        готовится заново.
+        """
+        if self.image_format == "original" or not path:
+            return
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return
+        with self._lock:
+            known = self._futures.get(path)
+            if known is not None and known[0] == mtime:
+                return
+            self._futures[path] = mtime, self._pool.submit(
+                optimize_image, path, self.image_format, self.image_quality, self.image_dpi,
+            )
+
+    def _prepared(self) -> dict[str, str]:
+        with self._lock:
+            futures = dict(self._futures)
+        if futures:
+            logging.info(f"⏳ Дожидаемся подготовки картинок отчёта: {len(futures)}")
+        prepared = {}
+        for path, (mtime, future) in futures.items():
+            # optimize_image не бросает исключений: при ошибке вернёт исходный путь
+            result = future.result()
+            try:
+                current = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            # Файл перезаписан после подготовки — копию сделает generate_report
+            if current == mtime:
+                prepared[path] = result
+        return prepared
+
+    def build(self, posts: list[dict], output_file: str = "Отчёт.docx", assets_dir: str = "assets",
+              inner_image: str = "inner.png", manifest=None, layout: str = "per-post") -> None:
+        """Собирает отчёт (см. generate_report) из подготовленных картинок и останавливает пул."""
+        try:
+            generate_report(posts, output_file, assets_dir=assets_dir, inner_image=inner_image,
+                            image_format=self.image_format, image_quality=self.image_quality,
+                            image_dpi=self.image_dpi, manifest=manifest, layout=layout,
+                            prepared=self._prepared())
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,71 @@
+"""Журнал прогона для продолжения после сбоя.
+
+SQLite-файл в папке с результатами: по мере работы в него пишутся готовые
+скриншоты постов и обработанные вкладки групп. При запуске с ``--resume``
+уже сделанная работа пропускается.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+
+class RunJournal:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # Соединение общее для воркеров, доступ сериализуется локом
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS posts ("
+                " path TEXT PRIMARY KEY, url TEXT NOT NULL, done_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS group_tabs ("
+                " group_id TEXT NOT NULL, tab TEXT NOT NULL, path TEXT, done_at REAL NOT NULL,"
+                " PRIMARY KEY (group_id, tab))"
+            )
+
+    def reset(self) -> None:
+        """Очищает журнал перед новым (не продолженным) прогоном."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM posts")
+            self._conn.execute("DELETE FROM group_tabs")
+
+    def post_done(self, url: str, path: str) -> bool:
+        """Скриншот поста *url* уже сделан в *path* и файл на месте."""
+        with self._lock:
+            row = self._conn.execute("SELECT url FROM posts WHERE path = ?", (path,)).fetchone()
+        return row is not None and row[0] == url and os.path.exists(path)
+
+    def mark_post(self, url: str, path: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO posts (path, url, done_at) VALUES (?, ?, ?)",
+                (path, url, time.time()),
+            )
+
+    def group_tabs_done(self, group_id: str) -> dict[str, str | None]:
+        """Вкладки группы, снятые в прошлых запусках (файлы на месте): вкладка → путь.
+
+        Вкладки, отмеченные без файла (съёмка не удалась), не возвращаются —
+        при ``--resume`` они снимаются заново.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT tab, path FROM group_tabs WHERE group_id = ?", (group_id,)
+            ).fetchall()
+        return {tab: path for tab, path in rows if path and os.path.exists(path)}
+
+    def mark_tab(self, group_id: str, tab: str, path: str | None) -> None:
+        """Отмечает вкладку обработанной; *path* пустой, если скриншота нет."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO group_tabs (group_id, tab, path, done_at) VALUES (?, ?, ?, ?)",
+                (group_id, tab, path, time.time()),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,169 @@
+"""Кэш скриншотов на диске с адресацией по содержимому.
+
+Ключ записи — хэш параметров съёмки (URL или ID группы, вкладка, период,
+размер окна, масштаб). Сами PNG лежат в ``blobs/`` под хэшем содержимого,
+поэтому одинаковые картинки хранятся один раз. Записи старше TTL считаются
+устаревшими, при превышении лимита размера удаляются давно не
+использованные.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+# Индекс пишется на диск раз в столько новых записей и в save()
+INDEX_FLUSH_EVERY = 50
+
+
+def date_range_from_url(ads_url: str) -> str:
+    """Период статистики из ссылки VK Ads: ``date_from..date_to``."""
+    query = dict(parse_qsl(urlsplit(ads_url).query))
+    return f"{query.get('date_from', '')}..{query.get('date_to', '')}"
+
+
+class ScreenshotCache:
+    def __init__(self, cache_dir: str = ".screenshot_cache", ttl_hours: float = 24,
+                 max_bytes: int = 2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.ttl = ttl_hours * 3600
+        self.max_bytes = max_bytes
+        self._blobs_dir = os.path.join(cache_dir, "blobs")
+        self._index_path = os.path.join(cache_dir, "index.json")
+        self._lock = threading.Lock()
+        os.makedirs(self._blobs_dir, exist_ok=True)
+        self._index = self._load_index()
+        # Размеры файлов в blobs/ и их сумма: папка читается при старте и при
+        # очистке, а не на каждую запись
+        self._blob_sizes = self._scan_blobs()
+        self._total = sum(self._blob_sizes.values())
+        # Сколько ключей ссылается на каждый blob: один blob может быть у нескольких ключей
+        self._refs: dict[str, int] = {}
+        for entry in self._index.values():
+            self._refs[entry["blob"]] = self._refs.get(entry["blob"], 0) + 1
+        self._unsaved = 0
+
+    @staticmethod
+    def key(*parts) -> str:
+        """Ключ записи по параметрам съёмки."""
+        raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _load_index(self) -> dict:
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self) -> None:
+        self._unsaved = 0
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self._index_path)
+
+    def _blob_path(self, blob: str) -> str:
+        return os.path.join(self._blobs_dir, f"{blob}.png")
+
+    def _scan_blobs(self) -> dict[str, int]:
+        sizes = {}
+        for name in os.listdir(self._blobs_dir):
+            if name.endswith(".png"):
+                sizes[name[:-4]] = os.path.getsize(os.path.join(self._blobs_dir, name))
+        return sizes
+
+    def _drop(self, key: str) -> str | None:
+        """Удаляет запись; возвращает её blob, если на него больше никто не ссылается."""
+        blob = self._index.pop(key)["blob"]
+        refs = self._refs.get(blob, 0) - 1
+        if refs > 0:
+            self._refs[blob] = refs
+            return None
+        self._refs.pop(blob, None)
+        return blob
+
+    def fetch(self, key: str, dest_path: str) -> bool:
+        """Копирует свежую запись в *dest_path*. False — записи нет или она устарела."""
+        with self._lock:
+            entry = self._index.get(key)
+            if not entry:
+                return False
+            blob_path = self._blob_path(entry["blob"])
+            if time.time() - entry["created"] > self.ttl or not os.path.exists(blob_path):
+                self._drop(key)
+                return False
+            entry["accessed"] = time.time()
+
+        dest_dir = os.path.dirname(dest_path)
+        if dest_dir:
+            os.makedirs(dest_dir, exist_ok=True)
+        try:
+            shutil.copyfile(blob_path, dest_path)
+        except OSError as e:
+            # Blob удалён очисткой из другого потока — считаем промахом
+            logging.debug(f"Кэш скриншотов: {blob_path} недоступен: {e}")
+            return False
+        return True
+
+    def put(self, key: str, src_path: str) -> None:
+        """Сохраняет файл *src_path* под ключом *key*."""
+        if not os.path.exists(src_path):
+            return
+        with open(src_path, "rb") as f:
+            blob = hashlib.sha256(f.read()).hexdigest()
+
+        with self._lock:
+            blob_path = self._blob_path(blob)
+            if blob not in self._blob_sizes or not os.path.exists(blob_path):
+                shutil.copyfile(src_path, blob_path)
+                size = os.path.getsize(blob_path)
+                self._total += size - self._blob_sizes.get(blob, 0)
+                self._blob_sizes[blob] = size
+            if key in self._index:
+                self._drop(key)
+            now = time.time()
+            self._index[key] = {"blob": blob, "created": now, "accessed": now}
+            self._refs[blob] = self._refs.get(blob, 0) + 1
+            self._unsaved += 1
+            if self._total > self.max_bytes:
+                self._evict()
+            elif self._unsaved >= INDEX_FLUSH_EVERY:
+                self._save_index()
+
+    def save(self) -> None:
+        """Сохраняет индекс (новые записи и время последнего доступа к ним)."""
+        with self._lock:
+            self._save_index()
+
+    def _evict(self) -> None:
+        """Удаляет устаревшие записи и самые давно использованные сверх лимита.
+
+        Вызывается, только когда сумма размеров превысила лимит.
+        """
+        now = time.time()
+        for key in [k for k, e in self._index.items() if now - e["created"] > self.ttl]:
+            self._drop(key)
+
+        # Размер считаем по уникальным файлам; файлы без ссылок удаляем сразу
+        sizes = self._scan_blobs()
+        for blob in [b for b in sizes if not self._refs.get(b)]:
+            os.remove(self._blob_path(blob))
+            del sizes[blob]
+
+        total = sum(sizes.values())
+        by_access = sorted(self._index, key=lambda k: self._index[k]["accessed"])
+        for key in by_access:
+            if total <= self.max_bytes:
+                break
+            blob = self._drop(key)
+            if blob is not None and blob in sizes:
+                total -= sizes.pop(blob)
+                os.remove(self._blob_path(blob))
+                logging.info(f"🗑️  Кэш скриншотов: удалён {blob[:12]}…")
+        self._blob_sizes = sizes
+        self._total = total
+        self._save_index()
@@ -1,52 +1,116 @@
 from PIL import Image, ImageDraw, ImageFont
 import requests
-from io import BytesIO
+import logging
 import os
+from io import BytesIO
+from functools import lru_cache
+
+# Настройки панели - увеличиваем высоту
+BAR_HEIGHT = 65  # Было 48, стало 65
+BG_COLOR = (242, 242, 242)
+TEXT_COLOR = (44, 44, 44)
+RADIUS = 10
+FAVICON_SIZE = 28
+FONT_SIZE = 18
 
-def draw_browser_bar(image_path, url):
-    # Настройки панели - увеличиваем высоту
-    bar_height = 65  # Было 48, стало 65
-    bg_color = (242, 242, 242)
-    text_color = (44, 44, 44)
-    radius = 10
-    favicon_size = 28
+FAVICON_URL = "https://vk.com/favicon.ico"
+# Локальная копия favicon: скачивается один раз prefetch_favicon() или кладётся вручную
+FAVICON_PATH = "vk_favicon.png"
+# Шрифты по порядку: Windows, затем то, что обычно есть в Linux/Docker
+FONT_CANDIDATES = ("arial.ttf", "DejaVuSans.ttf", "LiberationSans-Regular.ttf")
 
-    # Скачиваем favicon VK
-    favicon_url = "https://vk.com/favicon.ico"
+
+def prefetch_favicon(path: str = FAVICON_PATH) -> bool:
+    """Скачивает favicon VK в *path*, если его там ещё нет.
+
+    Вызывается один раз при старте, до съёмки: при обработке скриншотов
+    сеть не используется. False — favicon недоступен, панель рисуется без него.
+    """
+    if os.path.exists(path):
+        return True
     try:
-        fav_raw = requests.get(favicon_url, timeout=5).content
-        favicon = Image.open(BytesIO(fav_raw)).convert("RGBA").resize((favicon_size, favicon_size))
-    except Exception:
-        favicon = None
+        fav_raw = requests.get(FAVICON_URL, timeout=5).content
+        Image.open(BytesIO(fav_raw)).convert("RGBA").save(path)
+        logging.info(f"🖼️  Favicon VK сохранён: {path}")
+        return True
+    except Exception as e:
+        logging.warning(f"⚠️  Не удалось скачать favicon VK, панель будет без него: {e}")
+        return False
 
-    # Открываем скрин
-    image = Image.open(image_path).convert("RGB")
-    width, height = image.size
 
-    # Новый холст с местом под "адресную строку"
-    total_height = height + bar_height
-    new_img = Image.new('RGB', (width, total_height), bg_color)
-    new_img.paste(image, (0, bar_height))
+@lru_cache(maxsize=1)
+def _favicon_source():
+    try:
+        return Image.open(FAVICON_PATH).convert("RGBA")
+    except (OSError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=8)
+def _favicon(size):
+    """Favicon нужного размера из локальной копии (LRU по размеру)."""
+    source = _favicon_source()
+    return source.resize((size, size)) if source else None
+
+
+@lru_cache(maxsize=8)
+def _font(size):
+    """Шрифт URL: загружается один раз на размер."""
+    for name in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
 
-    draw = ImageDraw.Draw(new_img)
+
+def _bar_rect(width):
     # "Округленная" адресная строка - центрируем в новой высокой панели
-    bar_x, bar_y, bar_w, bar_h = 60, 16, width - 120, 32  # Сдвигаем bar_y с 10 на 16
-    draw.rounded_rectangle([bar_x, bar_y, bar_x + bar_w, bar_y + bar_h], radius, fill="white", outline=(220, 220, 220), width=1)
+    return 60, 16, width - 120, 32  # Сдвигаем bar_y с 10 на 16
+
+
+@lru_cache(maxsize=8)
+def _bar_template(width):
+    """Панель без текста URL: рисуется один раз на ширину и затем вставляется."""
+    bar = Image.new('RGB', (width, BAR_HEIGHT), BG_COLOR)
+    draw = ImageDraw.Draw(bar)
+    bar_x, bar_y, bar_w, bar_h = _bar_rect(width)
+    draw.rounded_rectangle([bar_x, bar_y, bar_x + bar_w, bar_y + bar_h], RADIUS, fill="white", outline=(220, 220, 220), width=1)
 
     # Favicon
+    favicon = _favicon(FAVICON_SIZE)
     if favicon:
-        new_img.paste(favicon, (bar_x + 8, bar_y + 2), favicon)
+        bar.paste(favicon, (bar_x + 8, bar_y + 2), favicon)
+    return bar
 
-    # Текст (url)
-    font_size = 18
-    try:
-        font = ImageFont.truetype("arial.ttf", font_size)
-    except:
-        font = ImageFont.load_default()
 
-    url_x = bar_x + favicon_size + 16
-    url_y = bar_y + (bar_h - font_size) // 2
-    draw.text((url_x, url_y), url, font=font, fill=text_color)
+def draw_browser_bar(image, url, output_path=None):
+    """Добавляет над скриншотом панель с адресной строкой и сохраняет результат.
+
+    Args:
+        image: PNG-байты (результат ``page.screenshot()``) или путь к файлу
+        url: Адрес, который пишется в строке
+        output_path: Куда сохранить; по умолчанию поверх *image*, если это путь
+    """
+    if isinstance(image, (bytes, bytearray)):
+        source = Image.open(BytesIO(image))
+    else:
+        source = Image.open(image)
+        output_path = output_path or image
+    source = source.convert("RGB")
+    width, height = source.size
+
+    # Новый холст с местом под "адресную строку"
+    new_img = Image.new('RGB', (width, height + BAR_HEIGHT), BG_COLOR)
+    new_img.paste(_bar_template(width), (0, 0))
+    new_img.paste(source, (0, BAR_HEIGHT))
+
+    # Текст (url)
+    font = _font(FONT_SIZE)
+    bar_x, bar_y, bar_w, bar_h = _bar_rect(width)
+    url_x = bar_x + FAVICON_SIZE + 16
+    url_y = bar_y + (bar_h - FONT_SIZE) // 2
+    ImageDraw.Draw(new_img).text((url_x, url_y), url, font=font, fill=TEXT_COLOR)
 
-    # Сохраняем поверх старого файла (или можно с другим именем)
-    new_img.save(image_path)
+    # Единственная запись файла
+    new_img.save(output_path)
@@ -0,0 +1,85 @@
+"""Запоминание сработавших селекторов из каскадов.
+
+Для каждого именованного каскада (кнопка статистики, крестик закрытия, поле
+поиска…) реестр помнит, какой кандидат сработал последним, и в следующий
+раз предлагает его раньше. Каскады упорядочены от точных селекторов к
+общим, поэтому победитель поднимается только среди соседних кандидатов той
+же специфичности и не обгоняет более точные. Победители сохраняются в JSON
+между запусками; если интерфейс поменялся, остальные кандидаты по-прежнему
+перебираются в исходном порядке.
+"""
+import json
+import logging
+import os
+import re
+import threading
+
+_QUOTED_RE = re.compile(r"'[^']*'|\"[^\"]*\"")
+_ENGINE_RE = re.compile(r"^[a-z_-]+=")
+
+
+def _specificity(selector: str) -> tuple[int, int, int]:
+    """Приблизительная CSS-специфичность: (id, классы/атрибуты/псевдоклассы, теги).
+
+    Движки Playwright (``text=…``) считаются самыми общими.
+    """
+    if _ENGINE_RE.match(selector):
+        return 0, 0, 0
+    rest = _QUOTED_RE.sub("", selector.replace("\\.", ""))
+    rest, attrs = re.subn(r"\[[^\]]*\]", " ", rest)
+    rest, pseudo = re.subn(r"::?[\w-]+", " ", rest)
+    rest, ids = re.subn(r"#[\w-]+", " ", rest)
+    rest, classes = re.subn(r"\.[\w-]+", " ", rest)
+    types = len(re.findall(r"(?<![\w-])[a-zA-Z][\w-]*", rest))
+    return ids, attrs + pseudo + classes, types
+
+
+class SelectorRegistry:
+    def __init__(self, path: str = "selectors_cache.json"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._winners: dict[str, list[str]] = json.load(f)
+        except (OSError, ValueError):
+            self._winners = {}
+
+    def ordered(self, name: str, candidates) -> list[str]:
+        """Кандидаты каскада *name*; прошлые победители подняты в начало своей
+        группы соседних кандидатов той же специфичности."""
+        candidates = list(candidates)
+        with self._lock:
+            winners = [sel for sel in self._winners.get(name, []) if sel in candidates]
+        # С последнего победителя, чтобы самый свежий оказался выше
+        for selector in reversed(winners):
+            specificity = _specificity(selector)
+            i = j = candidates.index(selector)
+            while j > 0 and _specificity(candidates[j - 1]) == specificity:
+                j -= 1
+            candidates.insert(j, candidates.pop(i))
+        return candidates
+
+    def record(self, name: str, selector: str) -> None:
+        """Отмечает *selector* победителем каскада *name*."""
+        with self._lock:
+            winners = self._winners.setdefault(name, [])
+            if winners and winners[0] == selector:
+                return
+            if selector in winners:
+                winners.remove(selector)
+            winners.insert(0, selector)
+            self._dirty = True
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self._winners, f, ensure_ascii=False, indent=1)
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+            except OSError as e:
+                logging.warning(f"⚠️  Не удалось сохранить порядок селекторов: {e}")
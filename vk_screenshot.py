@@ -1,80 +1,237 @@
 import os
 import json
 import logging
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from playwright.sync_api import sync_playwright
+from browser_utils import launch_chromium
 from screenshot_utils import draw_browser_bar
 
+POST_VIEWPORT = {"width": 1280, "height": 1000}
+
+
 def load_vk_cookies():
     with open('vk_storage.json', 'r', encoding='utf-8') as f:
         storage_data = json.load(f)
         return storage_data.get('cookies', [])
 
-def take_screenshot_with_views(url, output_file):
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=False)
-        context = browser.new_context(viewport={"width": 1280, "height": 1000})
 
-        cookies = load_vk_cookies()
-        context.add_cookies(cookies)
+def _new_post_context(browser, cookies):
+    """Создаёт контекст для скринов постов с уже загруженными cookies."""
+    context = browser.new_context(viewport=POST_VIEWPORT)
+    context.add_cookies(cookies)
+    return context
+
+
+def _capture_post(page, url, output_file, pipeline=None, on_saved=None) -> bool:
+    """Делает скриншот поста на уже открытой вкладке *page*.
+
+    Снимок берётся в память, панель браузера дорисовывается к нему, и файл
+    записывается один раз — сразу или в *pipeline* (ImagePipeline), если он
+    передан. После записи файла вызывается *on_saved*. Возвращает True, если
+    снимок сделан.
+    """
+    logging.info(f"Открываю пост: {url}")
+    try:
+        page.goto(url, timeout=60000, wait_until="domcontentloaded")
+    except Exception as e:
+        logging.error(f"Ошибка загрузки страницы: {e}")
+        return False
+
+    page.wait_for_timeout(4000)
+
+    try:
+        date_elem = page.locator('[data-testid="post_date_block_preview"]')
+        if date_elem.count() > 0:
+            date_elem.hover()
+            page.wait_for_timeout(1500)
+    except Exception as e:
+        logging.warning(f"Ошибка при наведении на дату: {e}")
 
+    try:
+        post = page.locator('.Post, .wall_post_text, .post')
+        if post.count() > 0:
+            # Получаем координаты поста
+            post_box = post.first.bounding_box()
+            if post_box:
+                # Расширяем область захвата для более широкого скриншота
+                page_width = page.evaluate("document.documentElement.scrollWidth")
+                viewport_width = page.evaluate("window.innerWidth")
+                full_width = max(page_width, viewport_width, 1200)  # Минимум 1200px
+
+                # Создаем расширенную область
+                expanded_area = {
+                    "x": 0,  # Начинаем с левого края
+                    "y": max(0, post_box["y"] - 50),  # Отступ сверху
+                    "width": full_width,  # Полная ширина
+                    "height": post_box["height"] + 100  # Отступ снизу
+                }
+
+                png = page.screenshot(clip=expanded_area)
+                logging.info(f"📸 Расширенный скриншот поста: {output_file}")
+            else:
+                # Fallback: скриншот элемента поста
+                png = post.first.screenshot()
+        else:
+            png = page.screenshot(full_page=True)
+    except Exception as e:
+        logging.error(f"Ошибка при создании скрина: {e}")
+        return False
+
+    if pipeline is not None:
+        pipeline.browser_bar(png, url, output_file, on_saved)
+        return True
+
+    draw_browser_bar(png, url, output_file)
+    if on_saved is not None:
+        on_saved()
+    return True
+
+
+def take_screenshot_with_views(url, output_file, headless: bool = False):
+    """Одиночный скриншот поста в отдельном браузере."""
+    with sync_playwright() as p:
+        browser = launch_chromium(p, headless)
+        context = _new_post_context(browser, load_vk_cookies())
         page = context.new_page()
-        logging.info(f"Открываю пост: {url}")
         try:
-            page.goto(url, timeout=60000, wait_until="domcontentloaded")
-        except Exception as e:
-            logging.error(f"Ошибка загрузки страницы: {e}")
+            _capture_post(page, url, output_file)
+        finally:
             browser.close()
-            return
 
-        page.wait_for_timeout(4000)
 
-        try:
-            date_elem = page.locator('[data-testid="post_date_block_preview"]')
-            if date_elem.count() > 0:
-                date_elem.hover()
-                page.wait_for_timeout(1500)
-        except Exception as e:
-            logging.warning(f"Ошибка при наведении на дату: {e}")
+def _post_cache_key(cache, url):
+    return cache.key("post", url, POST_VIEWPORT)
+
+
+def _post_saved(cache, journal, post, file_path, on_post_done=None):
+    url = post['Ссылка']
+    if cache is not None:
+        cache.put(_post_cache_key(cache, url), file_path)
+    if journal is not None:
+        journal.mark_post(url, file_path)
+    if on_post_done is not None:
+        on_post_done(post)
 
+
+def _post_worker(jobs, cookies, recycle_every: int, total: int, headless: bool = False,
+                 cache=None, journal=None, pipeline=None, on_post_done=None):
+    """Обрабатывает посты из очереди *jobs* в собственном браузере.
+
+    Sync API Playwright привязан к потоку, поэтому у каждого воркера свой
+    экземпляр playwright, браузер и контекст. Посты приходят по мере чтения
+    входа; None в очереди — входные данные закончились.
+    """
+    with sync_playwright() as p:
+        browser = launch_chromium(p, headless)
+        context = _new_post_context(browser, cookies)
+        page = context.new_page()
+        done = 0
         try:
-            post = page.locator('.Post, .wall_post_text, .post')
-            if post.count() > 0:
-                # Получаем координаты поста
-                post_box = post.first.bounding_box()
-                if post_box:
-                    # Расширяем область захвата для более широкого скриншота
-                    page_width = page.evaluate("document.documentElement.scrollWidth")
-                    viewport_width = page.evaluate("window.innerWidth")
-                    full_width = max(page_width, viewport_width, 1200)  # Минимум 1200px
-                    
-                    # Создаем расширенную область
-                    expanded_area = {
-                        "x": 0,  # Начинаем с левого края
-                        "y": max(0, post_box["y"] - 50),  # Отступ сверху
-                        "width": full_width,  # Полная ширина
-                        "height": post_box["height"] + 100  # Отступ снизу
-                    }
-                    
-                    page.screenshot(path=output_file, clip=expanded_area)
-                    logging.info(f"📸 Расширенный скриншот поста: {output_file}")
-                else:
-                    # Fallback: скриншот элемента поста
-                    post.first.screenshot(path=output_file)
-            else:
-                page.screenshot(path=output_file, full_page=True)
-        except Exception as e:
-            logging.error(f"Ошибка при создании скрина: {e}")
+            while True:
+                job = jobs.get()
+                if job is None:
+                    break
+                i, post, file_path = job
+
+                if recycle_every and done and done % recycle_every == 0:
+                    logging.info(f"♻️  Пересоздаю контекст браузера после {done} постов")
+                    context.close()
+                    context = _new_post_context(browser, cookies)
+                    page = context.new_page()
+                done += 1
+
+                url = post['Ссылка']
+                logging.info(f"[{i+1}/{total}] Скриншот: {url} -> {file_path}")
+                on_saved = lambda post=post, file_path=file_path: _post_saved(cache, journal, post, file_path, on_post_done)
+                try:
+                    _capture_post(page, url, file_path, pipeline, on_saved)
+                except Exception as e:
+                    # Вкладка могла упасть — начинаем со свежей
+                    logging.error(f"Ошибка при обработке поста {url}: {e}")
+                    try:
+                        page.close()
+                    except Exception:
+                        pass
+                    page = context.new_page()
         finally:
             browser.close()
 
-    draw_browser_bar(output_file, url)
 
-def batch_screenshots(posts, output_dir):
+def batch_screenshots(posts, output_dir, recycle_every: int = 50, workers: int = 1,
+                      headless: bool = False, cache=None, journal=None, pipeline=None,
+                      on_post_done=None) -> list:
+    """Скриншоты всех постов в долгоживущих браузерах.
+
+    *posts* — любой итерируемый источник (список или генератор из
+    post_loader.iter_valid_posts): посты забираются по одному, и съёмка
+    начинается, не дожидаясь конца входа. Возвращает список прочитанных
+    постов с заполненным ключом «Скриншот».
+
+    Браузер и контекст (с cookies из vk_storage.json) создаются один раз на
+    воркер, вкладка переиспользуется между постами. Каждые *recycle_every*
+    постов контекст пересоздаётся, чтобы не копить память; 0 — не пересоздавать.
+    При *workers* > 1 посты разбираются из общей очереди параллельно.
+    Путь к файлу зависит только от номера поста, поэтому ключ «Скриншот»
+    заполняется одинаково при любом числе воркеров.
+    *headless* запускает браузеры без окна. Если передан *cache*
+    (ScreenshotCache), свежие скриншоты берутся из него без браузера.
+    Готовые посты отмечаются в *journal* (RunJournal); уже отмеченные там
+    посты пропускаются. С *pipeline* (ImagePipeline) панель браузера
+    дорисовывается в фоновых процессах, пока браузер снимает следующие посты.
+    *on_post_done* (post) вызывается, когда файл скриншота поста готов
+    (в том числе из журнала или кэша).
+    """
     os.makedirs(output_dir, exist_ok=True)
-    for i, post in enumerate(posts):
-        url = post['Ссылка']
-        file_name = f"post_{i+1}.png"
-        file_path = os.path.join(output_dir, file_name)
-        logging.info(f"[{i+1}/{len(posts)}] Скриншот: {url} -> {file_path}")
-        take_screenshot_with_views(url, file_path)
-        post['Скриншот'] = file_path
+
+    jobs = queue.Queue()
+    total = len(posts) if hasattr(posts, "__len__") else "?"
+    consumed = []
+    queued = 0
+    pool = None
+    futures = []
+    try:
+        for i, post in enumerate(posts):
+            consumed.append(post)
+            file_path = os.path.join(output_dir, f"post_{i+1}.png")
+            post['Скриншот'] = file_path
+            if journal is not None and journal.post_done(post['Ссылка'], file_path):
+                logging.info(f"[{i+1}/{total}] Уже готов (журнал): {file_path}")
+                if on_post_done is not None:
+                    on_post_done(post)
+                continue
+            if cache is not None and cache.fetch(_post_cache_key(cache, post['Ссылка']), file_path):
+                logging.info(f"[{i+1}/{total}] Скриншот из кэша: {post['Ссылка']} -> {file_path}")
+                if journal is not None:
+                    journal.mark_post(post['Ссылка'], file_path)
+                if on_post_done is not None:
+                    on_post_done(post)
+                continue
+
+            if pool is None:
+                # Браузеры запускаются только при первом посте, которого нет в кэше/журнале
+                cookies = load_vk_cookies()
+                workers = max(1, workers)
+                if workers > 1:
+                    logging.info(f"🧵 Скриншоты постов в {workers} потоках")
+                pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="post")
+                futures = [
+                    pool.submit(_post_worker, jobs, cookies, recycle_every, total, headless, cache, journal,
+                                pipeline, on_post_done)
+                    for _ in range(workers)
+                ]
+            jobs.put((i, post, file_path))
+            queued += 1
+    finally:
+        # Сигнал воркерам, что постов больше не будет
+        for _ in futures:
+            jobs.put(None)
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    if cache is not None:
+        cache.save()
+    logging.info(f"📸 Готово заранее: {len(consumed) - queued}, снято: {queued}")
+    for future in futures:
+        future.result()
+    return consumed
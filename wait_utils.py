@@ -0,0 +1,221 @@
+"""Ожидания по событиям вместо фиксированных пауз.
+
+Вместо ``page.wait_for_timeout(N)`` код ждёт именованное условие готовности
+(``wait_ready(page, "stats")``): видимость селектора, исчезновение спиннера,
+затишье сети или DOM. Затишье сети считается по событиям запросов страницы,
+а не по ``networkidle``: состояние загрузки после первого достижения не
+сбрасывается и после действий в SPA (клик по вкладке, поиск) не ждёт ничего. Таймауты условий умножаются на коэффициент глобального
+профиля (fast/normal/slow), фактическое время каждого ожидания пишется в лог.
+"""
+import logging
+import time
+import weakref
+
+# Коэффициенты таймаутов для профилей
+WAIT_PROFILES = {"fast": 0.5, "normal": 1.0, "slow": 2.0}
+
+_profile = "normal"
+
+# Индикаторы загрузки в интерфейсе VK Ads
+SPINNER_SELECTOR = (
+    "[class*='Spinner'], [class*='spinner'], [class*='Loader_'], "
+    "[class*='Skeleton'], [class*='skeleton'], [aria-busy='true']"
+)
+
+# Условия готовности: список шагов (условие, параметры, базовый таймаут в мс).
+# Шаги выполняются по очереди, общий результат — успех всех шагов.
+READINESS = {
+    # Дашборд после загрузки / смены масштаба
+    "dashboard": [
+        ("selector_visible", {"selector": "[data-testid='name-link'], input[type='search']"}, 15_000),
+        ("spinner_hidden", {}, 10_000),
+        ("dom_quiet", {"quiet_ms": 500}, 6_000),
+    ],
+    # Таблица групп после поиска / очистки поиска
+    "search_results": [
+        ("network_quiet", {"quiet_ms": 300}, 5_000),
+        ("spinner_hidden", {}, 5_000),
+        ("dom_quiet", {"quiet_ms": 400}, 4_000),
+    ],
+    # Панель статистики открыта
+    "stats": [
+        ("selector_visible", {"selector": "#tab_overview"}, 10_000),
+        ("spinner_hidden", {}, 10_000),
+    ],
+    # Панель статистики закрыта
+    "stats_closed": [
+        ("selector_hidden", {"selector": "#tab_overview"}, 3_000),
+    ],
+    # Содержимое вкладки статистики отрисовано
+    "tab": [
+        ("network_quiet", {"quiet_ms": 300}, 4_000),
+        ("spinner_hidden", {}, 4_000),
+        ("dom_quiet", {"quiet_ms": 400}, 3_000),
+    ],
+    # Вкладка «География»: карта появилась и перестала меняться
+    "geo_map": [
+        ("network_quiet", {"quiet_ms": 500}, 6_000),
+        ("selector_attached", {"selector": "canvas.mmrgl-canvas, div.mmrgl-map, canvas, "
+                                           "div[class*='GeoMap'], div[class*='map']"}, 30_000),
+        ("spinner_hidden", {}, 6_000),
+        ("dom_quiet", {"quiet_ms": 800}, 6_000),
+    ],
+    # Запросы страницы (XHR/fetch) завершились
+    "network": [
+        ("network_quiet", {"quiet_ms": 500}, 6_000),
+    ],
+    # Перерасчёт вёрстки после смены масштаба
+    "layout": [
+        ("dom_quiet", {"quiet_ms": 300}, 3_000),
+    ],
+    # Страница после переходов авторизации VK ID
+    "page": [
+        ("load_state", {"state": "domcontentloaded"}, 10_000),
+        ("dom_quiet", {"quiet_ms": 500}, 4_000),
+    ],
+    # Капчу решает человек — таймаут не зависит от профиля
+    "captcha_solved": [
+        ("selector_hidden", {"selector": 'input[name="captcha_key"], .page_block_captcha, [id*="captcha"]',
+                             "scale": False}, 30_000),
+    ],
+}
+
+_DOM_QUIET_JS = """
+([quietMs, timeoutMs]) => new Promise(resolve => {
+    let timer = null;
+    const observer = new MutationObserver(() => {
+        clearTimeout(timer);
+        timer = setTimeout(done, quietMs);
+    });
+    const hardStop = setTimeout(() => { observer.disconnect(); clearTimeout(timer); resolve(false); }, timeoutMs);
+    function done() { observer.disconnect(); clearTimeout(hardStop); resolve(true); }
+    observer.observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+    timer = setTimeout(done, quietMs);
+})
+"""
+
+
+# Долгоживущие соединения не мешают затишью
+_IGNORED_RESOURCE_TYPES = ("websocket", "eventsource")
+
+
+class _RequestTracker:
+    """Незавершённые запросы страницы и время последнего изменения.
+
+    События приходят в потоке, которому принадлежит страница, во время
+    любых вызовов sync API (в том числе ``wait_for_timeout``).
+    """
+
+    def __init__(self, page):
+        self.inflight = set()
+        self.changed = time.monotonic()
+        page.on("request", self._started)
+        page.on("requestfinished", self._finished)
+        page.on("requestfailed", self._finished)
+
+    def _started(self, request) -> None:
+        if request.resource_type in _IGNORED_RESOURCE_TYPES:
+            return
+        self.inflight.add(request)
+        self.changed = time.monotonic()
+
+    def _finished(self, request) -> None:
+        if request in self.inflight:
+            self.inflight.discard(request)
+            self.changed = time.monotonic()
+
+
+_trackers: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def track_requests(page) -> _RequestTracker:
+    """Подписывает страницу на события запросов (один раз на страницу)."""
+    tracker = _trackers.get(page)
+    if tracker is None:
+        tracker = _trackers[page] = _RequestTracker(page)
+    return tracker
+
+
+def _wait_network_quiet(page, quiet_ms: int, timeout_ms: int) -> bool:
+    """Ждёт, пока нет незавершённых запросов и новых событий *quiet_ms* мс.
+
+    Тишина отсчитывается не раньше начала ожидания: запросы, которые
+    действие (клик, ввод) запустит с небольшой задержкой, тоже дождёмся.
+    """
+    tracker = track_requests(page)
+    started = time.monotonic()
+    deadline = started + timeout_ms / 1000
+    while True:
+        now = time.monotonic()
+        if not tracker.inflight and now - max(tracker.changed, started) >= quiet_ms / 1000:
+            return True
+        if now >= deadline:
+            return False
+        page.wait_for_timeout(50)
+
+
+def set_wait_profile(name: str) -> None:
+    """Выбирает глобальный профиль таймаутов: fast, normal или slow."""
+    global _profile
+    if name not in WAIT_PROFILES:
+        raise ValueError(f"Неизвестный профиль ожиданий: {name} (есть {', '.join(WAIT_PROFILES)})")
+    _profile = name
+    logging.info(f"⏱️  Профиль ожиданий: {name}")
+
+
+def get_wait_profile() -> str:
+    return _profile
+
+
+def _scaled(ms: int) -> int:
+    return int(ms * WAIT_PROFILES[_profile])
+
+
+def _wait_condition(page, condition: str, params: dict, timeout_ms: int) -> bool:
+    if condition == "selector_visible":
+        page.locator(params["selector"]).first.wait_for(state="visible", timeout=timeout_ms)
+    elif condition == "selector_attached":
+        page.locator(params["selector"]).first.wait_for(state="attached", timeout=timeout_ms)
+    elif condition == "selector_hidden":
+        page.locator(params["selector"]).first.wait_for(state="hidden", timeout=timeout_ms)
+    elif condition == "spinner_hidden":
+        page.locator(SPINNER_SELECTOR).first.wait_for(state="hidden", timeout=timeout_ms)
+    elif condition == "network_quiet":
+        return _wait_network_quiet(page, params.get("quiet_ms", 500), timeout_ms)
+    elif condition == "load_state":
+        page.wait_for_load_state(params.get("state", "load"), timeout=timeout_ms)
+    elif condition == "dom_quiet":
+        return bool(page.evaluate(_DOM_QUIET_JS, [params.get("quiet_ms", 500), timeout_ms]))
+    else:
+        raise ValueError(f"Неизвестное условие ожидания: {condition}")
+    return True
+
+
+def wait_ready(page, name: str) -> bool:
+    """Ждёт именованное условие готовности из READINESS.
+
+    Никогда не бросает исключение по таймауту: возвращает False и пишет
+    предупреждение, чтобы вызывающий код продолжил работу как раньше.
+    """
+    # Подписка на запросы с первого ожидания на странице — до действий в SPA
+    track_requests(page)
+    started = time.monotonic()
+    ok = True
+    for condition, params, base_timeout in READINESS[name]:
+        timeout_ms = _scaled(base_timeout) if params.get("scale", True) else base_timeout
+        try:
+            ok = _wait_condition(page, condition, params, timeout_ms) and ok
+        except Exception:
+            ok = False
+            logging.debug(f"⏱️  '{name}': шаг {condition} не дождался за {timeout_ms} мс")
+    elapsed = int((time.monotonic() - started) * 1000)
+    if ok:
+        logging.info(f"⏱️  Ожидание '{name}': {elapsed} мс")
+    else:
+        logging.warning(f"⏱️  Ожидание '{name}' не выполнено полностью: {elapsed} мс, продолжаем")
+    return ok
+
+
+def pause(page, ms: int) -> None:
+    """Короткая пауза под анимацию (hover, прокрутка) с учётом профиля."""
+    page.wait_for_timeout(_scaled(ms))